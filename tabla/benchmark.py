@@ -0,0 +1,365 @@
+# Mediciones de los motores alternativos contra los originales.
+# Uso: python benchmark.py [seccion ...] [--escala N]
+# Sin secciones corre todas; --escala multiplica el tamano de las entradas.
+import contextlib
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Iterator
+
+import tablasimbolos as T
+
+DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datos.txt')
+
+
+def best(f, n=3)->float:
+    # Mejor tiempo de n corridas (la maquina suele estar cargada)
+    mejor = float('inf')
+    for _ in range(n):
+        gc.collect()
+        t = time.perf_counter()
+        f()
+        mejor = min(mejor, time.perf_counter() - t)
+    return mejor
+
+def allocated(f):
+    # Bytes que siguen reservados despues de construir f()
+    gc.collect()
+    tracemalloc.start()
+    obj = f()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return obj, size
+
+def datos(veces: int)->str:
+    with open(DATOS, encoding='utf-8') as f:
+        return f.read() * veces
+
+
+def bench_lexer(escala: int):
+    src = datos(1000 * escala)
+    with open(DATOS, 'rb') as f:
+        raw = f.read() * (1000 * escala)
+    n = len(T.Lexer(src).tokenize())
+    print(f"lexer: {n} tokens")
+    for nombre, f in [
+        ('Lexer', lambda: T.Lexer(src).tokenize()),
+        ('RegexLexer', lambda: T.RegexLexer(src).tokenize()),
+        ('RegexLexer lazy', lambda: T.RegexLexer(src, lazy_positions=True).tokenize()),
+        ('RegexLexer pool', lambda: T.RegexLexer(src, pool=T.StringPool()).tokenize()),
+        ('RegexLexer bytes', lambda: T.RegexLexer(raw).tokenize()),
+        ('TokenStream', lambda: T.TokenStream.from_text(src)),
+    ]:
+        t = best(f)
+        print(f"  {nombre:18} {t:7.3f}s  {n / t:12,.0f} tok/s")
+
+def bench_tokens(escala: int):
+    src = datos(500 * escala)
+    tokens, lista = allocated(lambda: T.RegexLexer(src).tokenize())
+    n = len(tokens)
+    del tokens
+    _, lazy = allocated(lambda: T.RegexLexer(src, lazy_positions=True).tokenize())
+    stream, columnas = allocated(lambda: T.TokenStream.from_text(src))
+    print(f"tokens: {n} tokens, bytes por token")
+    print(f"  List[Token]        {lista / n:7.1f}")
+    print(f"  List[LazyToken]    {lazy / n:7.1f}")
+    print(f"  TokenStream        {columnas / n:7.1f}  (columnas {stream.nbytes() / n:.1f})")
+
+def bench_paralelo(escala: int):
+    src = datos(3000 * escala)
+    lista = best(lambda: T.RegexLexer(src).tokenize())
+    serie = best(lambda: T.TokenStream.from_text(src))
+    print(f"paralelo: {len(src)} caracteres, {os.cpu_count()} cpus")
+    print(f"  RegexLexer         {lista:7.3f}s")
+    print(f"  TokenStream        {serie:7.3f}s")
+    for workers in (1, 2, 4, 8):
+        t = best(lambda: T.tokenize_parallel(src, workers=workers))
+        print(f"  {workers} workers          {t:7.3f}s  x{serie / t:.2f} sobre TokenStream")
+
+def bench_parseo_paralelo(escala: int):
+    tokens = T.RegexLexer(datos(1000 * escala), pool=T.StringPool()).tokenize()
+    serie = best(lambda: T.Parser(tokens).parse())
+    print(f"parseo_paralelo: {len(tokens)} tokens, {os.cpu_count()} cpus")
+    print(f"  Parser.parse       {serie:7.3f}s")
+    for workers in (2, 4, 8):
+        t = best(lambda: T.Parser(tokens).parse_parallel(workers=workers))
+        print(f"  {workers} workers          {t:7.3f}s  x{serie / t:.2f}")
+
+class _Cascada(T.Parser):
+    # La cadena de un metodo por nivel que usaba el Parser antes de la tabla
+    # de precedencias (parse_rel -> parse_add -> parse_mul -> parse_unary),
+    # escrita como tareas de run_stack igual que el resto del Parser.
+    NIVELES = (('==', '!=', '<', '>', '<=', '>='), ('+', '-'), ('*', '/'))
+
+    def _parse_expr(self, min_prec: int=1):
+        return self._nivel(0)
+
+    def _nivel(self, k: int):
+        ops = self.NIVELES[k]
+        siguiente = self._nivel if k + 1 < len(self.NIVELES) else None
+        node = yield (siguiente(k + 1) if siguiente else self._parse_unary())
+        while self.current().tipo == 'OP' and self.current().lexema in ops:
+            op = self.eat('OP').lexema
+            right = yield (siguiente(k + 1) if siguiente else self._parse_unary())
+            node = self._new(T.BinaryOp(node, op, right))
+        return node
+
+def bench_precedencia(escala: int):
+    ops = ('+', '*', '-', '/', '<', '+', '-', '*', '==', '+')
+    lineas = []
+    for i in range(20 * escala):
+        terms = [f"a{j % 7}" if j % 3 else str(j) for j in range(3000)]
+        lineas.append(f"x{i} = {terms[0]}" + ''.join(f" {ops[j % len(ops)]} {t}" for j, t in enumerate(terms[1:])) + ';')
+    tokens = T.RegexLexer('\n'.join(lineas)).tokenize()
+    dot = T.ASTVisualizer().render(T.Parser(tokens).parse())
+    assert dot == T.ASTVisualizer().render(_Cascada(tokens).parse())
+    print(f"precedencia: {len(lineas)} expresiones de 3000 terminos, {len(tokens)} tokens")
+    for nombre, cls in (('un metodo por nivel', _Cascada), ('precedence climbing', T.Parser)):
+        t = best(lambda: cls(tokens).parse())
+        print(f"  {nombre:20} {t:7.3f}s")
+
+def bench_incremental(escala: int):
+    src = datos(3000 * escala)
+    inc = T.IncrementalLexer(src)
+    completo = best(lambda: T.TokenStream.from_text(src))
+    print(f"incremental: {len(src)} caracteres, re-tokenizar todo {completo:.3f}s")
+    for nombre, at in (('inicio', 20), ('mitad', len(src) // 2), ('final', len(src) - 20)):
+        def editar():
+            for _ in range(100):
+                inc.edit(at, at, 'x')
+                inc.edit(at, at + 1, '')
+        t = best(editar) / 200
+        print(f"  edit al {nombre:8} {t * 1e6:9.1f} us")
+
+def bench_anidado(escala: int):
+    n = 100000 * escala
+    casos = {
+        'parentesis': 'x = ' + '(' * n + '1' + ')' * n + ';',
+        'bloques': '{ ' * n + 'x = 1;' + ' }' * n,
+        'ifs': 'if (a) { ' * n + 'x = 1;' + ' }' * n,
+    }
+    print(f"anidado: {n} niveles")
+    for nombre, src in casos.items():
+        tokens = T.RegexLexer(src).tokenize()
+        t = time.perf_counter(); prog = T.Parser(tokens).parse()
+        t1 = time.perf_counter(); T.ASTVisualizer().render(prog)
+        t2 = time.perf_counter(); T.TACGenerator().generate(prog)
+        t3 = time.perf_counter()
+        print(f"  {nombre:12} parse {t1 - t:6.2f}s  dot {t2 - t1:6.2f}s  tac {t3 - t2:6.2f}s")
+        del prog
+
+def _con_dict(prog: T.ASTNode)->list:
+    # Los mismos nodos en clases sin __slots__, como antes de que ASTNode los
+    # declarara; los hijos y las listas se comparten con el arbol original.
+    clases = {}
+    copias = []
+    for node in T.walk(prog):
+        cls = node.__class__
+        plana = clases.get(cls)
+        if plana is None:
+            plana = clases[cls] = type(cls.__name__, (), {})
+        copia = plana()
+        for k in cls.__mro__:
+            for slot in getattr(k, '__slots__', ()):
+                if hasattr(node, slot):
+                    setattr(copia, slot, getattr(node, slot))
+        copias.append(copia)
+    return copias
+
+def bench_nodos(escala: int):
+    tokens = T.RegexLexer(datos(500 * escala)).tokenize()
+    prog, arbol = allocated(lambda: T.Parser(tokens).parse())
+    n = sum(1 for _ in T.walk(prog))
+    # Arbol con __dict__: se cambian los nodos con slots por sus copias y el
+    # resto (listas, tuplas de posicion) queda igual
+    copias, dicts = allocated(lambda: _con_dict(prog))
+    dicts -= sys.getsizeof(copias)
+    del copias
+    slots = sum(sys.getsizeof(node) for node in T.walk(prog))
+    _, plano = allocated(lambda: T.FlatAST.from_tree(prog))
+    _, compartido = allocated(lambda: T.Parser(tokens, exprs=T.ExprFactory()).parse())
+    _, con_pos = allocated(lambda: T.Parser(tokens, exprs=T.ExprFactory(), positions=True).parse())
+    mb = 1 << 20
+    print(f"nodos: {n} nodos, nodos por MB")
+    print(f"  ASTNode (__dict__)    {n * mb / (arbol - slots + dicts):10,.0f}")
+    print(f"  ASTNode (__slots__)   {n * mb / arbol:10,.0f}")
+    print(f"  ASTNode + ExprFactory {n * mb / compartido:10,.0f}")
+    print(f"  ExprFactory con pos   {n * mb / con_pos:10,.0f}")
+    print(f"  FlatAST               {n * mb / plano:10,.0f}")
+
+def bench_plano(escala: int):
+    prog = T.Parser(T.RegexLexer(datos(500 * escala)).tokenize()).parse()
+    flat = T.FlatAST.from_tree(prog)
+    print(f"plano: {len(flat.ids)} nodos, recorrido completo")
+    for nombre, f in [
+        ('walk(arbol)', lambda: sum(1 for _ in T.walk(prog))),
+        ('FlatAST.preorder', lambda: sum(1 for _ in flat.preorder())),
+        ('FlatAST.postorder', lambda: sum(1 for _ in flat.postorder())),
+        ('TAC arbol', lambda: T.TACGenerator().generate(prog)),
+        ('TAC FlatAST.view', lambda: T.TACGenerator().generate(flat.view())),
+    ]:
+        # datos repetido redeclara los globales; se callan los avisos
+        with contextlib.redirect_stdout(io.StringIO()):
+            t = best(f)
+        print(f"  {nombre:18} {t:7.3f}s")
+
+class _Contador(T.NodeVisitor):
+    visit_prefix = 'visit_'
+    def generic_visit(self, node):
+        return node
+
+def bench_despacho(escala: int):
+    nodes = list(T.walk(T.Parser(T.RegexLexer(datos(300 * escala)).tokenize()).parse()))
+    v = _Contador()
+    def por_nombre():
+        # Lo que hacia accept antes: armar el nombre y getattr en cada visita
+        for node in nodes:
+            getattr(v, 'visit_' + node.__class__.__name__, v.generic_visit)(node)
+    def por_tabla():
+        dispatch = v.dispatch
+        for node in nodes:
+            dispatch(node)
+    antes, despues = best(por_nombre), best(por_tabla)
+    n = len(nodes)
+    print(f"despacho: {n} nodos, ns por nodo")
+    print(f"  getattr por visita {antes * 1e9 / n:7.1f}")
+    print(f"  tabla _dispatch    {despues * 1e9 / n:7.1f}")
+
+class _TablaEscaneo:
+    # SymbolTable de antes del indice por nombre: un dict por scope abierto y
+    # lookup los recorre del mas interno al global.
+    def __init__(self):
+        self.scopes = [{}]
+        self.address_counter = 0
+
+    def enter_scope(self):
+        self.scopes.append({})
+
+    def exit_scope(self):
+        if len(self.scopes) > 1:
+            self.scopes.pop()
+
+    def current_level(self)->int:
+        return len(self.scopes)-1
+
+    def add(self, entry: T.SymbolEntry):
+        if entry.name in self.scopes[-1]:
+            print(f"Warning: redeclaracion de '{entry.name}' en scope {self.current_level()}")
+        if entry.sym_type in ('var','const','param','array') and entry.address is None:
+            entry.address = self.address_counter
+            entry.size = entry.size if entry.size is not None else 8
+            self.address_counter += entry.size
+        entry.scope_level = self.current_level()
+        self.scopes[-1][entry.name] = entry
+
+    def lookup(self, name: str):
+        for s in reversed(self.scopes):
+            if name in s:
+                return s[name]
+        return None
+
+def bench_simbolos(escala: int):
+    print("simbolos: ns por lookup de un global segun profundidad de anidamiento")
+    print(f"  {'profundidad':12} {'escaneo':>9} {'_bindings':>10}")
+    consultas = 200000 * escala
+    for depth in (1, 10, 100, 1000):
+        tiempos = []
+        for cls in (_TablaEscaneo, T.SymbolTable):
+            st = cls()
+            st.add(T.SymbolEntry('x', 'var', 'int'))
+            for d in range(depth):
+                st.enter_scope()
+                st.add(T.SymbolEntry(f"y{d}", 'var', 'int'))
+            lookup = st.lookup
+            # El escaneo es lineal en la profundidad: menos consultas
+            n = consultas if cls is T.SymbolTable else max(consultas // depth, 2000)
+            tiempos.append(best(lambda: [lookup('x') for _ in range(n)]) * 1e9 / n)
+        print(f"  {depth:<12} {tiempos[0]:9.1f} {tiempos[1]:10.1f}")
+
+def _simbolos(n: int)->Iterator[dict]:
+    # Mezcla parecida a la de TACGenerator: variables, etiquetas y funciones
+    for i in range(n):
+        if i % 10 == 9:
+            yield dict(name=f"L{i}", sym_type='label', label=f"L{i}")
+        elif i % 10 == 8:
+            yield dict(name=f"f{i}", sym_type='function', data_type='int', params=['a', 'b'],
+                       return_type='int', label=f"f{i}")
+        else:
+            yield dict(name=f"v{i}", sym_type='var', data_type='int', address=i * 8, size=8)
+
+def _tabla(n: int)->T.SymbolTable:
+    st = T.SymbolTable()
+    for fields in _simbolos(n):
+        st.declare(**fields)
+    return st
+
+def _store(n: int)->T.SymbolStore:
+    store = T.SymbolStore()
+    for f in _simbolos(n):
+        store.append(f['name'], f['sym_type'], f.get('data_type'), 0, f.get('address'), f.get('size'),
+                     f.get('params'), f.get('return_type'), f.get('label'), None)
+    return store
+
+def bench_memoria_simbolos(escala: int):
+    # List[SymbolEntry] y SymbolStore son solo los registros; SymbolTable
+    # suma los indices (_bindings, shadow, scopes, referencias cruzadas)
+    n = 200000 * escala
+    _, objetos = allocated(lambda: [T.SymbolEntry(**fields) for fields in _simbolos(n)])
+    _, columnas = allocated(lambda: _store(n))
+    _, tabla = allocated(lambda: _tabla(n))
+    print(f"memoria_simbolos: {n} simbolos, bytes por simbolo")
+    print(f"  List[SymbolEntry]  {objetos / n:7.1f}")
+    print(f"  SymbolStore        {columnas / n:7.1f}")
+    print(f"  SymbolTable        {tabla / n:7.1f}")
+
+def bench_sqlite(escala: int):
+    n = 1000000 * escala
+    st = _tabla(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'simbolos.db')
+        t = time.perf_counter(); st.export_sqlite(path); exporta = time.perf_counter() - t
+        del st
+        print(f"sqlite: {n} simbolos, {os.path.getsize(path) / 1e6:.1f} MB")
+        print(f"  export_sqlite          {exporta:7.2f}s")
+        t = time.perf_counter()
+        db = T.SymbolDB(path)
+        db.lookup('v12345')
+        print(f"  abrir + primer lookup  {time.perf_counter() - t:7.4f}s")
+        names = [f"v{i}" for i in range(0, n, max(1, n // 10000))]
+        t = best(lambda: [db.lookup(name) for name in names])
+        print(f"  lookup                 {t * 1e6 / len(names):7.1f} us")
+        t = best(lambda: db.of_kind('label'), 1)
+        print(f"  of_kind('label')       {t:7.2f}s")
+        db.close()
+
+SECCIONES = {
+    'lexer': bench_lexer,
+    'tokens': bench_tokens,
+    'paralelo': bench_paralelo,
+    'parseo_paralelo': bench_parseo_paralelo,
+    'precedencia': bench_precedencia,
+    'incremental': bench_incremental,
+    'anidado': bench_anidado,
+    'nodos': bench_nodos,
+    'plano': bench_plano,
+    'despacho': bench_despacho,
+    'simbolos': bench_simbolos,
+    'memoria_simbolos': bench_memoria_simbolos,
+    'sqlite': bench_sqlite,
+}
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    escala = 1
+    if '--escala' in args:
+        k = args.index('--escala')
+        escala = int(args[k + 1])
+        del args[k:k + 2]
+    for nombre in args or SECCIONES:
+        if nombre not in SECCIONES:
+            sys.exit(f"Seccion desconocida '{nombre}'; opciones: {', '.join(SECCIONES)}")
+        SECCIONES[nombre](escala)
@@ -1,8 +1,23 @@
-from dataclasses import dataclass
-from typing import List, Optional, Any, Dict, Tuple
+from dataclasses import dataclass, field
+from types import GeneratorType
+from typing import List, Optional, Any, Dict, Tuple, Iterable, Iterator, TextIO
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from bisect import bisect_right
+from heapq import heappop, heappush
+from itertools import accumulate
+import gc
+import hashlib
+import marshal
+import mmap
+import os
+import re
 import subprocess
 import shutil
+import sqlite3
 import sys
+import zlib
 
 class DotParser:
     
@@ -401,8 +416,85 @@ class Token:
     lexema: str
     linea: int
     columna: int
+    ident: Optional[int] = field(default=None, compare=False)
+    @property
+    def texto(self)->str:
+        # Con fuentes bytes/mmap el lexema de ID y NUMBER es un memoryview;
+        # solo se decodifica cuando alguien necesita el texto.
+        lex = self.lexema
+        return lex if lex.__class__ is str else str(lex, 'utf-8')
     def __repr__(self):
-        return f"Token({self.tipo}, '{self.lexema}', {self.linea}, {self.columna})"
+        return f"Token({self.tipo}, '{self.texto}', {self.linea}, {self.columna})"
+
+class StringPool:
+    # Un id entero estable y una sola copia de texto por identificador
+    # distinto; lo comparten Lexer, Parser (name_id) y SymbolTable.
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def intern(self, name: str)->int:
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def name(self, i: int)->str:
+        return self.names[i]
+
+    def __len__(self)->int:
+        return len(self.names)
+
+
+class LineIndex:
+    # Tabla de inicios de linea de un texto, construida con un barrido de
+    # find('\n') la primera vez que se pide una posicion.
+    def __init__(self, text):
+        self.text = text
+        self._starts: Optional[List[int]] = None
+
+    @property
+    def starts(self)->List[int]:
+        if self._starts is None:
+            text = self.text
+            nl = '\n' if isinstance(text, str) else b'\n'
+            find = text.find
+            starts = [0]
+            i = find(nl)
+            while i != -1:
+                starts.append(i + 1)
+                i = find(nl, i + 1)
+            self._starts = starts
+        return self._starts
+
+    def position(self, offset: int)->Tuple[int, int]:
+        starts = self.starts
+        line = bisect_right(starts, offset)
+        return line, offset - starts[line - 1] + 1
+
+
+class LazyToken(Token):
+    # Token que solo guarda su offset; linea y columna se resuelven con el
+    # LineIndex de la fuente cuando alguien las lee (normalmente un error).
+    def __init__(self, tipo: str, lexema: str, offset: int, index: LineIndex):
+        self.tipo = tipo
+        self.lexema = lexema
+        self.offset = offset
+        self.index = index
+
+    @property
+    def linea(self)->int:
+        return self.index.position(self.offset)[0]
+
+    @property
+    def columna(self)->int:
+        return self.index.position(self.offset)[1]
+
+    def __eq__(self, other):
+        if not isinstance(other, Token):
+            return NotImplemented
+        return (self.tipo, self.lexema, self.linea, self.columna) == (other.tipo, other.lexema, other.linea, other.columna)
 
 KEYWORDS = {
     "if":"IF","else":"ELSE","while":"WHILE","return":"RETURN",
@@ -410,97 +502,300 @@ KEYWORDS = {
     "array":"ARRAY","type":"TYPE"
 }
 
+class IdAllocator:
+    # Ids de nodo de una compilacion: el Parser, el Program resultante y el
+    # ASTVisualizer (para sus nodos auxiliares) comparten el mismo, asi que
+    # los nombres n<id> del DOT no dependen de compilaciones anteriores.
+    __slots__ = ('next',)
+    def __init__(self, start: int=0):
+        self.next = start
+    def take(self)->int:
+        n = self.next
+        self.next = n + 1
+        return n
+
 class ASTNode:
-    _id_counter = 0
+    # _fields: atributos que guardan hijos (nodos o listas de nodos)
+    # _attrs: atributos simples (nombres, operadores, valores)
+    # Los slots de POSITION_SLOTS (posicion del nombre en la fuente) no estan
+    # en _attrs para no contar en la igualdad de expresiones, pero ASTCache y
+    # FlatAST los guardan igual. Una posicion es (linea, columna) o, si el
+    # lexer no las calculo, el LazyToken del nombre; _position la resuelve.
+    __slots__ = ('id',)
+    _fields: Tuple[str, ...] = ()
+    _attrs: Tuple[str, ...] = ()
     def __init__(self):
-        self.id = ASTNode._id_counter
-        ASTNode._id_counter += 1
+        # -1 hasta que un IdAllocator le asigne id
+        self.id = -1
     def accept(self, visitor):
+        if isinstance(visitor, NodeVisitor):
+            return run_stack(visitor.dispatch(self))
         return getattr(visitor, 'visit_' + self.__class__.__name__)(self)
 
+def iter_child_nodes(node: ASTNode)->Iterator[ASTNode]:
+    for name in node._fields:
+        value = getattr(node, name, None)
+        if isinstance(value, ASTNode):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, ASTNode):
+                    yield item
+
+def walk(node: ASTNode)->Iterator[ASTNode]:
+    # Recorrido en preorden con pila explicita
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(list(iter_child_nodes(node))))
+
+POSITION_SLOTS = ('pos', 'param_pos')
+
+def _position(pos)->Optional[Tuple[int,int]]:
+    if pos is None or pos.__class__ is tuple:
+        return pos
+    return pos.index.position(pos.offset)
+
+def _stored_position(node: 'ASTNode', name: str):
+    # Valor de un slot de POSITION_SLOTS con los LazyToken ya resueltos
+    value = getattr(node, name)
+    if name == 'param_pos':
+        return [_position(p) for p in value]
+    return _position(value)
+
 class Program(ASTNode):
-    def __init__(self, decls: List['Decl']):
+    __slots__ = ('decls', 'ids')
+    _fields = ('decls',)
+    def __init__(self, decls: List['Decl'], ids: Optional[IdAllocator]=None):
         super().__init__()
         self.decls = decls
+        self.ids = ids
 
 class Decl(ASTNode):
-    pass
+    __slots__ = ()
 
 class Stmt(ASTNode):
-    pass
+    __slots__ = ()
 
 class Expr(ASTNode):
-    pass
+    # Igualdad y hash estructurales: dos expresiones son iguales si tienen la
+    # misma clase, atributos e hijos; el id no cuenta. El hash se calcula una
+    # vez por nodo (las expresiones no se modifican despues del parser), asi
+    # que con nodos compartidos por ExprFactory comparar es casi siempre `is`.
+    __slots__ = ('_shash',)
+
+    def __hash__(self)->int:
+        try:
+            return self._shash
+        except AttributeError:
+            pass
+        stack: List[Tuple[Expr, bool]] = [(self, False)]
+        while stack:
+            node, ready = stack.pop()
+            if not ready:
+                if not hasattr(node, '_shash'):
+                    stack.append((node, True))
+                    stack.extend((c, False) for c in iter_child_nodes(node))
+                continue
+            parts: List[Any] = [node.__class__.__name__]
+            parts.extend(getattr(node, a) for a in node._attrs)
+            for name in node._fields:
+                value = getattr(node, name)
+                parts.append(tuple(map(hash, value)) if isinstance(value, list) else hash(value))
+            node._shash = hash(tuple(parts))
+        return self._shash
+
+    def __eq__(self, other)->bool:
+        if self is other:
+            return True
+        if not isinstance(other, Expr):
+            return NotImplemented
+        stack: List[Tuple[Any, Any]] = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if a.__class__ is not b.__class__ or hash(a) != hash(b):
+                return False
+            for name in a._attrs:
+                if getattr(a, name) != getattr(b, name):
+                    return False
+            for name in a._fields:
+                x, y = getattr(a, name), getattr(b, name)
+                if isinstance(x, list):
+                    if len(x) != len(y):
+                        return False
+                    stack.extend(zip(x, y))
+                else:
+                    stack.append((x, y))
+        return True
+
+class ExprFactory:
+    # Hash-consing de expresiones: Parser(exprs=ExprFactory()) devuelve la
+    # instancia ya creada cuando un subarbol es estructuralmente igual a uno
+    # anterior. Los nodos compartidos no deben modificarse. La posicion de un
+    # nombre es de cada aparicion y un nodo compartido no puede guardarla,
+    # asi que un Parser con factory no anota posiciones: se comparte todo
+    # (tambien Var, Call y ArrayAccess) y la tabla de simbolos queda sin
+    # referencias cruzadas. Con Parser(positions=True) se conservan las
+    # posiciones y los nodos con nombre dejan de compartirse.
+    # Como los hijos ya estan compartidos, la clave usa su identidad en vez
+    # de comparar subarboles; la tabla los mantiene vivos.
+    KEYS = {
+        'Number': lambda n: ('Number', n.value),
+        'Var': lambda n: ('Var', n.name),
+        'BinaryOp': lambda n: ('BinaryOp', n.op, id(n.left), id(n.right)),
+        'Call': lambda n: ('Call', n.name, tuple(map(id, n.args))),
+        'ArrayAccess': lambda n: ('ArrayAccess', n.name, id(n.index)),
+        'FieldAccess': lambda n: ('FieldAccess', n.field, id(n.expr)),
+    }
+
+    def __init__(self):
+        self.table: Dict[Any, Expr] = {}
+        self.hits = 0
+
+    def intern(self, node: Expr)->Optional[Expr]:
+        # None si el nodo es nuevo (queda registrado)
+        key_of = self.KEYS.get(node.__class__.__name__)
+        key = key_of(node) if key_of is not None else node
+        shared = self.table.get(key)
+        if shared is None:
+            self.table[key] = node
+            return None
+        self.hits += 1
+        return shared
+
+    def __len__(self)->int:
+        return len(self.table)
 
 class ConstDecl(Decl):
+    __slots__ = ('name', 'value', 'pos')
+    _fields = ('value',)
+    _attrs = ('name',)
     def __init__(self, name: str, value: Expr):
         super().__init__()
         self.name = name
         self.value = value
+        self.pos: Optional[Tuple[int,int]] = None
 
 class VarDecl(Decl):
+    __slots__ = ('name', 'typ', 'pos')
+    _attrs = ('name', 'typ')
     def __init__(self, name: str, typ: Optional[str]=None):
         super().__init__()
         self.name = name
         self.typ = typ
+        self.pos: Optional[Tuple[int,int]] = None
 
 class ArrayDecl(Decl):
+    __slots__ = ('name', 'size', 'pos')
+    _attrs = ('name', 'size')
     def __init__(self, name: str, size: int):
         super().__init__()
         self.name = name
         self.size = size
+        self.pos: Optional[Tuple[int,int]] = None
 
 class TypeDecl(Decl):
+    __slots__ = ('name', 'fields', 'pos')
+    _attrs = ('name', 'fields')
     def __init__(self, name: str, fields: List[Tuple[str, Optional[str]]]):
         super().__init__()
         self.name = name
         self.fields = fields
+        self.pos: Optional[Tuple[int,int]] = None
+
+def _get_body(self)->List[Stmt]:
+    if self._lazy is not None:
+        self._body = self._lazy()
+        self._lazy = None
+    return self._body
+
+def _set_body(self, stmts: List[Stmt]):
+    self._body = stmts
+    self._lazy = None
 
 class FunctionDecl(Decl):
-    def __init__(self, name: str, params: List[Tuple[str,str]], ret_type: Optional[str], body: List[Stmt]):
+    # Con Parser(lazy_bodies=True) el cuerpo se parsea al leer .body
+    # span: (linea, columna, linea_fin, columna_fin) de toda la declaracion
+    __slots__ = ('name', 'params', 'ret_type', '_body', '_lazy', 'span', 'pos', 'param_pos')
+    _fields = ('body',)
+    _attrs = ('name', 'params', 'ret_type', 'span')
+    body = property(_get_body, _set_body)
+    def __init__(self, name: str, params: List[Tuple[str,str]], ret_type: Optional[str], body: List[Stmt], span: Optional[Tuple[int,int,int,int]]=None):
         super().__init__()
         self.name = name
         self.params = params
         self.ret_type = ret_type
         self.body = body
+        self.span = span
+        self.pos: Optional[Tuple[int,int]] = None
+        self.param_pos: List[Tuple[int,int]] = []
 
 class ProcedureDecl(Decl):
-    def __init__(self, name: str, params: List[Tuple[str,str]], body: List[Stmt]):
+    __slots__ = ('name', 'params', '_body', '_lazy', 'span', 'pos', 'param_pos')
+    _fields = ('body',)
+    _attrs = ('name', 'params', 'span')
+    body = property(_get_body, _set_body)
+    def __init__(self, name: str, params: List[Tuple[str,str]], body: List[Stmt], span: Optional[Tuple[int,int,int,int]]=None):
         super().__init__()
         self.name = name
         self.params = params
         self.body = body
+        self.span = span
+        self.pos: Optional[Tuple[int,int]] = None
+        self.param_pos: List[Tuple[int,int]] = []
 
 class Assign(Stmt):
+    __slots__ = ('target', 'expr')
+    _fields = ('target', 'expr')
     def __init__(self, target: Expr, expr: Expr):
         super().__init__()
         self.target = target
         self.expr = expr
 
 class If(Stmt):
-    def __init__(self, cond: Expr, then_block: List[Stmt], else_block: Optional[List[Stmt]]):
+    __slots__ = ('cond', 'then_block', 'else_block', 'then_span', 'else_span')
+    _fields = ('cond', 'then_block', 'else_block')
+    _attrs = ('then_span', 'else_span')
+    def __init__(self, cond: Expr, then_block: List[Stmt], else_block: Optional[List[Stmt]], then_span: Optional[Tuple[int,int,int,int]]=None, else_span: Optional[Tuple[int,int,int,int]]=None):
         super().__init__()
         self.cond = cond
         self.then_block = then_block
         self.else_block = else_block
+        self.then_span = then_span
+        self.else_span = else_span
 
 class While(Stmt):
-    def __init__(self, cond: Expr, body: List[Stmt]):
+    __slots__ = ('cond', 'body', 'body_span')
+    _fields = ('cond', 'body')
+    _attrs = ('body_span',)
+    def __init__(self, cond: Expr, body: List[Stmt], body_span: Optional[Tuple[int,int,int,int]]=None):
         super().__init__()
         self.cond = cond
         self.body = body
+        self.body_span = body_span
 
 class Return(Stmt):
+    __slots__ = ('expr',)
+    _fields = ('expr',)
     def __init__(self, expr: Optional[Expr]):
         super().__init__()
         self.expr = expr
 
 class ExprStmt(Stmt):
+    # block solo existe en los bloques { ... } sueltos
+    __slots__ = ('expr', 'block')
+    _fields = ('expr', 'block')
     def __init__(self, expr: Expr):
         super().__init__()
         self.expr = expr
 
 class BinaryOp(Expr):
+    __slots__ = ('left', 'op', 'right')
+    _fields = ('left', 'right')
+    _attrs = ('op',)
     def __init__(self, left: Expr, op: str, right: Expr):
         super().__init__()
         self.left = left
@@ -508,28 +803,47 @@ class BinaryOp(Expr):
         self.right = right
 
 class Number(Expr):
+    __slots__ = ('value',)
+    _attrs = ('value',)
     def __init__(self, value: float):
         super().__init__()
         self.value = value
 
 class Var(Expr):
+    __slots__ = ('name', 'name_id', 'pos')
+    _attrs = ('name',)
     def __init__(self, name: str):
         super().__init__()
         self.name = name
+        self.name_id: Optional[int] = None
+        self.pos: Optional[Tuple[int,int]] = None
 
 class Call(Expr):
+    __slots__ = ('name', 'args', 'name_id', 'pos')
+    _fields = ('args',)
+    _attrs = ('name',)
     def __init__(self, name: str, args: List[Expr]):
         super().__init__()
         self.name = name
         self.args = args
+        self.name_id: Optional[int] = None
+        self.pos: Optional[Tuple[int,int]] = None
 
 class ArrayAccess(Expr):
+    __slots__ = ('name', 'index', 'name_id', 'pos')
+    _fields = ('index',)
+    _attrs = ('name',)
     def __init__(self, name: str, index: Expr):
         super().__init__()
         self.name = name
         self.index = index
+        self.name_id: Optional[int] = None
+        self.pos: Optional[Tuple[int,int]] = None
 
 class FieldAccess(Expr):
+    __slots__ = ('expr', 'field')
+    _fields = ('expr',)
+    _attrs = ('field',)
     def __init__(self, expr: Expr, field: str):
         super().__init__()
         self.expr = expr
@@ -548,47 +862,519 @@ class SymbolEntry:
     label: Optional[str] = None
     extra: Dict[str, Any] = None
 
-class SymbolTable:
+class SymbolStore:
+    # Los simbolos se guardan por columnas, una fila por simbolo: los campos
+    # de texto repetidos (kind, tipo, retorno) como codigos array('i') sobre
+    # values, address/size en array('q') con -1 para None, y params / extra,
+    # que casi nunca se usan, en dicts fila -> valor. name y label son listas
+    # comunes: cada label es de un solo simbolo y codificarlo no ahorraria
+    # nada. SymbolEntry solo se crea como vista (SymbolView) de una fila.
+    CODED = ('sym_type', 'data_type', 'return_type')
+    OPTIONAL = ('address', 'size')
+    SPARSE = ('params', 'extra')
+
     def __init__(self):
-        self.scopes: List[Dict[str, SymbolEntry]] = [{}]
-        self.address_counter = 0
+        self.names: List[str] = []
+        self.labels: List[Optional[str]] = []
+        self.values: List[Any] = [None]
+        self._codes: Dict[Any, int] = {None: 0}
+        self.columns: Dict[str, array] = {k: array('i') for k in self.CODED + ('scope_level',)}
+        for k in self.OPTIONAL:
+            self.columns[k] = array('q')
+        self.sparse: Dict[str, Dict[int, Any]] = {k: {} for k in self.SPARSE}
+
+    def __len__(self)->int:
+        return len(self.names)
+
+    def code(self, value: Any)->int:
+        c = self._codes.get(value)
+        if c is None:
+            c = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return c
+
+    def append(self, name: str, sym_type: str, data_type: Optional[str], scope_level: int,
+               address: Optional[int], size: Optional[int], params: Optional[List[str]],
+               return_type: Optional[str], label: Optional[str], extra: Optional[Dict[str, Any]])->int:
+        row = len(self.names)
+        self.names.append(name)
+        self.labels.append(label)
+        cols, code = self.columns, self.code
+        cols['sym_type'].append(code(sym_type))
+        cols['data_type'].append(code(data_type))
+        cols['return_type'].append(code(return_type))
+        cols['scope_level'].append(scope_level)
+        cols['address'].append(-1 if address is None else address)
+        cols['size'].append(-1 if size is None else size)
+        if params is not None:
+            self.sparse['params'][row] = params
+        if extra is not None:
+            self.sparse['extra'][row] = extra
+        return row
+
+    def get(self, row: int, name: str)->Any:
+        if name == 'name':
+            return self.names[row]
+        if name == 'label':
+            return self.labels[row]
+        col = self.columns.get(name)
+        if col is None:
+            return self.sparse[name].get(row)
+        v = col[row]
+        if name in self.CODED:
+            return self.values[v]
+        if name in self.OPTIONAL and v < 0:
+            return None
+        return v
 
-    def enter_scope(self):
-        self.scopes.append({})
+    def set(self, row: int, name: str, value: Any):
+        if name == 'name':
+            self.names[row] = value
+            return
+        if name == 'label':
+            self.labels[row] = value
+            return
+        col = self.columns.get(name)
+        if col is None:
+            if value is None:
+                self.sparse[name].pop(row, None)
+            else:
+                self.sparse[name][row] = value
+        elif name in self.CODED:
+            col[row] = self.code(value)
+        elif name in self.OPTIONAL and value is None:
+            col[row] = -1
+        else:
+            col[row] = value
+
+    def entry(self, row: int)->'SymbolView':
+        return SymbolView(self, row)
+
+class SymbolView(SymbolEntry):
+    # SymbolEntry que lee y escribe una fila de SymbolStore; los campos son
+    # propiedades que se agregan abajo, una por campo del dataclass.
+    def __init__(self, store: SymbolStore, row: int):
+        self._store = store
+        self._row = row
+
+def _column_property(name: str)->property:
+    return property(lambda self: self._store.get(self._row, name),
+                    lambda self, value: self._store.set(self._row, name, value))
+
+for _f in SymbolEntry.__dataclass_fields__:
+    setattr(SymbolView, _f, _column_property(_f))
+
+@dataclass(eq=False)
+class Scope:
+    # rows: filas del SymbolStore declaradas en este scope, en orden.
+    # Offsets dentro del frame: offset es donde empieza el scope, top donde
+    # empiezan sus bloques hijos y peak el fin del ultimo slot usado por el
+    # scope o sus hijos. frame_size solo en los scopes que abren frame (root
+    # y funciones), al cerrarlos.
+    level: int
+    kind: str = 'global'
+    span: Optional[Tuple[int,int,int,int]] = None
+    parent: Optional['Scope'] = field(default=None, repr=False)
+    index: int = 0
+    children: List['Scope'] = field(default_factory=list, repr=False)
+    rows: array = field(default_factory=lambda: array('i'), repr=False)
+    frame: bool = False
+    offset: int = 0
+    top: int = 0
+    peak: int = 0
+    frame_size: Optional[int] = None
+class IntervalIndex:
+    # Intervalos anidados o disjuntos (como los spans de los scopes) partidos
+    # en intervalos elementales: bounds[k] es donde empieza el k-esimo y
+    # values[k] el valor del intervalo mas interno que lo cubre. Una consulta
+    # es un bisect sobre bounds. Se ordena por (inicio, -fin, orden de
+    # llegada): de dos intervalos con el mismo inicio el externo va primero y
+    # el interno lo tapa, y con el mismo span gana el que llego despues (los
+    # scopes llegan de padre a hijo). Los valores nunca se comparan.
+    def __init__(self, items: Iterable[Tuple[Tuple[int,int,int,int], Any]], default: Any=None):
+        self.default = default
+        self.bounds: List[Tuple[int,int]] = []
+        self.values: List[Any] = []
+        ordered = sorted(((l1, c1, -l2, -c2, k), (l2, c2), v) for k, ((l1, c1, l2, c2), v) in enumerate(items))
+        open_: List[Tuple[Tuple[int,int], Any]] = []
+        for key, end, value in ordered:
+            start = key[:2]
+            while open_ and open_[-1][0] <= start:
+                self._mark(open_.pop()[0], open_[-1][1] if open_ else default)
+            open_.append((end, value))
+            self._mark(start, value)
+        while open_:
+            self._mark(open_.pop()[0], open_[-1][1] if open_ else default)
+
+    def _mark(self, pos: Tuple[int,int], value: Any):
+        if self.bounds and self.bounds[-1] == pos:
+            self.values[-1] = value
+        else:
+            self.bounds.append(pos)
+            self.values.append(value)
 
-    def exit_scope(self):
+    def at(self, line: int, col: int)->Any:
+        k = bisect_right(self.bounds, (line, col)) - 1
+        return self.values[k] if k >= 0 else self.default
+
+# Tipos de uso que guardan las referencias cruzadas de SymbolTable
+REF_KINDS = ('read', 'write', 'call')
+REF_CODES = {k: i for i, k in enumerate(REF_KINDS)}
+
+class SymbolTable:
+    def __init__(self, pool: Optional[StringPool]=None, align: int=8):
+        # Con pool, los simbolos se indexan por el id del nombre en vez del str.
+        # Los simbolos viven en store; _bindings da por nombre la fila visible
+        # (la del scope mas interno) y la columna shadow la fila que esa tapa,
+        # asi lookup es un acceso a dict y exit_scope deshace con las filas
+        # del scope. Los scopes cerrados no se tiran: quedan en el arbol que
+        # cuelga de root (all_scopes en orden de creacion) para consultas por
+        # posicion. scopes son los abiertos.
+        # Las direcciones son offsets dentro del frame del scope: uno global y
+        # uno por funcion (enter_scope(frame=True)). Un bloque empieza en el
+        # top de su padre, asi los bloques hermanos (then/else, whiles
+        # seguidos) comparten slots; una variable que el padre declara despues
+        # va por encima de todos ellos, porque en un while sigue viva mientras
+        # se repiten los bloques. Offsets y tamanos de frame son multiplos de
+        # align.
+        self.pool = pool
+        self.align = align
+        self.store = SymbolStore()
+        self.shadow = array('i')
+        self.scope_of = array('i')
+        self.root = Scope(0)
+        self.all_scopes: List[Scope] = [self.root]
+        self.scopes: List[Scope] = [self.root]
+        self._bindings: Dict[Any, int] = {}
+        self._views: Dict[int, SymbolView] = {}
+        self._scope_index: Optional[IntervalIndex] = None
+        self._name_index: Dict[Any, IntervalIndex] = {}
+        self._decls: Optional[Dict[Any, List[int]]] = None
+        self.root.frame = True
+        # Referencias cruzadas: def_line/def_col dan por fila donde se declaro
+        # (-1 si no se sabe) y cada uso es una fila de las columnas ref_*.
+        # ref_last[fila*len(REF_KINDS)+tipo] es el ultimo uso de ese tipo y
+        # ref_prev encadena los anteriores, asi uses() recorre solo resultados.
+        self.def_line = array('i')
+        self.def_col = array('i')
+        self.ref_line = array('i')
+        self.ref_col = array('i')
+        self.ref_prev = array('i')
+        self.ref_last = array('i')
+
+    @property
+    def address_counter(self)->int:
+        return self._aligned(self.root.peak)
+
+    def _aligned(self, n: int)->int:
+        return -(-n // self.align) * self.align
+
+    def enter_scope(self, span: Optional[Tuple[int,int,int,int]]=None, kind: str='block', frame: bool=False):
+        parent = self.scopes[-1]
+        scope = Scope(len(self.scopes), kind, span, parent, len(self.all_scopes), frame=frame)
+        if not frame:
+            scope.offset = scope.top = scope.peak = parent.top
+        parent.children.append(scope)
+        self.all_scopes.append(scope)
+        self.scopes.append(scope)
+        self._scope_index = None
+        self._name_index = {}
+        self._decls = None
+
+    def exit_scope(self)->Optional[Scope]:
+        # Devuelve el scope cerrado (con frame_size si abria frame)
         if len(self.scopes) > 1:
-            self.scopes.pop()
+            bindings, shadow, names = self._bindings, self.shadow, self.store.names
+            scope = self.scopes.pop()
+            for row in scope.rows:
+                key = self._key(names[row])
+                prev = shadow[row]
+                if prev < 0:
+                    del bindings[key]
+                else:
+                    bindings[key] = prev
+            if scope.frame:
+                scope.frame_size = self._aligned(scope.peak)
+            else:
+                scope.parent.peak = max(scope.parent.peak, scope.peak)
+            return scope
+        return None
 
     def current_level(self)->int:
         return len(self.scopes)-1
 
-    def add(self, entry: SymbolEntry):
-        if entry.name in self.scopes[-1]:
-            print(f"Warning: redeclaracion de '{entry.name}' en scope {self.current_level()}")
-        if entry.sym_type in ('var','const','param','array') and entry.address is None:
-            entry.address = self.address_counter
-            entry.size = entry.size if entry.size is not None else 8
-            self.address_counter += entry.size
-        entry.scope_level = self.current_level()
-        self.scopes[-1][entry.name] = entry
+    def _key(self, name: str):
+        return name if self.pool is None else self.pool.intern(name)
+
+    def declare(self, name: str, sym_type: str, data_type: Optional[str]=None, address: Optional[int]=None,
+                size: Optional[int]=None, params: Optional[List[str]]=None, return_type: Optional[str]=None,
+                label: Optional[str]=None, extra: Optional[Dict[str, Any]]=None,
+                pos: Optional[Tuple[int,int]]=None)->int:
+        # Como add pero sin armar un SymbolEntry; devuelve la fila en store.
+        # pos es el sitio de la declaracion para las referencias cruzadas
+        # ((linea, columna) o el LazyToken del nombre).
+        key = self._key(name)
+        pos = _position(pos)
+        scope = self.scopes[-1]
+        prev = self._bindings.get(key, -1)
+        redeclared = prev >= 0 and self.scope_of[prev] == scope.index
+        if redeclared:
+            print(f"Warning: redeclaracion de '{name}' en scope {self.current_level()}")
+        if sym_type in ('var','const','param','array') and address is None:
+            size = size if size is not None else 8
+            address = self._allocate(size)
+        row = self.store.append(name, sym_type, data_type, self.current_level(), address, size, params, return_type, label, extra)
+        self.scope_of.append(scope.index)
+        self.def_line.append(-1 if pos is None else pos[0])
+        self.def_col.append(-1 if pos is None else pos[1])
+        self.ref_last.extend((-1,) * len(REF_KINDS))
+        if redeclared:
+            self.shadow.append(self.shadow[prev])
+            scope.rows[scope.rows.index(prev)] = row
+        else:
+            self.shadow.append(prev)
+            scope.rows.append(row)
+        self._bindings[key] = row
+        if self._decls is not None:
+            self._decls = None
+            self._name_index = {}
+        return row
+
+    def _allocate(self, size: int)->int:
+        scope = self.scopes[-1]
+        address = self._aligned(scope.peak)
+        scope.top = scope.peak = address + size
+        return address
+
+    def add(self, entry: SymbolEntry, pos: Optional[Tuple[int,int]]=None):
+        # Un SymbolEntry suelto pasa a ser la vista de su fila: lookup
+        # devuelve ese mismo objeto y lo que se le asigne llega a las columnas.
+        # Otras clases (vistas de otra tabla) solo reciben nivel y direccion.
+        row = self.declare(entry.name, entry.sym_type, entry.data_type, entry.address, entry.size,
+                           entry.params, entry.return_type, entry.label, entry.extra, pos)
+        if entry.__class__ is SymbolEntry:
+            entry.__class__ = SymbolView
+            entry.__dict__ = {'_store': self.store, '_row': row}
+            self._views[row] = entry
+            return
+        store = self.store
+        entry.scope_level = store.get(row, 'scope_level')
+        entry.address = store.get(row, 'address')
+        entry.size = store.get(row, 'size')
+
+    def entry(self, row: int)->SymbolView:
+        # Una sola vista por fila, como cuando la tabla guardaba los objetos
+        view = self._views.get(row)
+        if view is None:
+            view = self._views[row] = self.store.entry(row)
+        return view
+
+    def find(self, name: str)->int:
+        # Como lookup pero devuelve la fila (-1 si no esta) sin crear vista
+        if self.pool is not None:
+            name = self.pool.ids.get(name)
+            if name is None:
+                return -1
+        return self._bindings.get(name, -1)
+
+    def find_id(self, ident: int)->int:
+        return self._bindings.get(ident, -1)
+
+    def refer(self, row: int, kind: str, pos: Optional[Tuple[int,int]]):
+        # Anota un uso de la fila; los nodos sin posicion (armados a mano,
+        # no por el Parser) no tienen sitio que anotar.
+        if pos is None:
+            return
+        if pos.__class__ is not tuple:
+            pos = pos.index.position(pos.offset)
+        slot = row * len(REF_KINDS) + REF_CODES[kind]
+        self.ref_prev.append(self.ref_last[slot])
+        self.ref_line.append(pos[0])
+        self.ref_col.append(pos[1])
+        self.ref_last[slot] = len(self.ref_line) - 1
+
+    def _row_of(self, entry: SymbolEntry)->int:
+        if not isinstance(entry, SymbolView) or entry._store is not self.store:
+            raise Exception(f"El simbolo '{entry.name}' no es de esta tabla")
+        return entry._row
+
+    def definition(self, entry: SymbolEntry)->Optional[Tuple[int,int]]:
+        row = self._row_of(entry)
+        return None if self.def_line[row] < 0 else (self.def_line[row], self.def_col[row])
+
+    def uses(self, entry: SymbolEntry, kind: Optional[str]=None)->List[Tuple[int,int,str]]:
+        # Usos de un simbolo de lookup/lookup_at en el orden de generacion:
+        # (linea, columna, tipo), solo de un tipo si se da kind.
+        row = self._row_of(entry)
+        kinds = REF_KINDS if kind is None else (kind,)
+        found = []
+        for k in kinds:
+            i = self.ref_last[row * len(REF_KINDS) + REF_CODES[k]]
+            while i >= 0:
+                found.append((i, k))
+                i = self.ref_prev[i]
+        found.sort()
+        return [(self.ref_line[i], self.ref_col[i], k) for i, k in found]
+
+    def lookup(self, name: str)->Optional[SymbolEntry]:
+        if self.pool is not None:
+            key = self.pool.ids.get(name)
+            if key is None:
+                return None
+            name = key
+        row = self._bindings.get(name)
+        if row is None:
+            return None
+        view = self._views.get(row)
+        return view if view is not None else self.entry(row)
+
+    def lookup_id(self, ident: int)->Optional[SymbolEntry]:
+        row = self._bindings.get(ident)
+        if row is None:
+            return None
+        view = self._views.get(row)
+        return view if view is not None else self.entry(row)
+
+    def scope_at(self, line: int, col: int)->Scope:
+        # Scope mas interno que contiene la posicion; los scopes sin span
+        # (enter_scope() sin argumentos) no se pueden ubicar y se ignoran.
+        if self._scope_index is None:
+            self._scope_index = IntervalIndex(((s.span, s) for s in self.all_scopes if s.span is not None), self.root)
+        return self._scope_index.at(line, col)
+
+    def lookup_at(self, name: str, line: int, col: int)->Optional[SymbolEntry]:
+        # A que declaracion se refiere name en la posicion (linea, columna),
+        # con un indice de intervalos por nombre que se arma en la primera
+        # consulta de ese nombre.
+        key = self._key(name) if self.pool is None else self.pool.ids.get(name)
+        if key is None:
+            return None
+        if self._decls is None:
+            decls: Dict[Any, List[int]] = {}
+            names = self.store.names
+            for s in self.all_scopes:
+                for row in s.rows:
+                    decls.setdefault(self._key(names[row]), []).append(row)
+            self._decls = decls
+        index = self._name_index.get(key)
+        if index is None:
+            scopes, scope_of = self.all_scopes, self.scope_of
+            rows = self._decls.get(key, ())
+            default = next((r for r in rows if scope_of[r] == 0), None)
+            index = IntervalIndex(((scopes[scope_of[r]].span, r) for r in rows
+                                   if scopes[scope_of[r]].span is not None), default)
+            self._name_index[key] = index
+        row = index.at(line, col)
+        return None if row is None else self.entry(row)
+
+    def export_sqlite(self, path: str):
+        # Vuelca todos los scopes (tambien los cerrados) y sus simbolos a una
+        # base SQLite con indices por nombre y por kind; se lee con SymbolDB.
+        # params y extra van en marshal, como las entradas de ASTCache.
+        if os.path.exists(path):
+            os.remove(path)
+        store = self.store
+        cols, values, sparse = store.columns, store.values, store.sparse
+        kinds, types, rets, labels = cols['sym_type'], cols['data_type'], cols['return_type'], store.labels
+        levels, addrs, sizes = cols['scope_level'], cols['address'], cols['size']
+        params, extra = sparse['params'], sparse['extra']
+        def symbols():
+            for scope in self.all_scopes:
+                for row in scope.rows:
+                    p, x = params.get(row), extra.get(row)
+                    yield (store.names[row], values[kinds[row]], values[types[row]], scope.index, levels[row],
+                           None if addrs[row] < 0 else addrs[row], None if sizes[row] < 0 else sizes[row],
+                           None if p is None else marshal.dumps(p), values[rets[row]], labels[row],
+                           None if x is None else marshal.dumps(x))
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute("PRAGMA journal_mode=OFF")
+            conn.execute("PRAGMA synchronous=OFF")
+            conn.executescript(SymbolDB.SCHEMA)
+            conn.executemany("INSERT INTO scopes VALUES (?,?,?,?,?,?,?,?,?)",
+                             ((sc.index, None if sc.parent is None else sc.parent.index, sc.level, sc.kind)
+                              + (sc.span or (None,)*4) + (sc.frame_size,) for sc in self.all_scopes))
+            conn.executemany("INSERT INTO symbols (name, kind, data_type, scope, scope_level, address, size, params, return_type, label, extra)"
+                             " VALUES (?,?,?,?,?,?,?,?,?,?,?)", symbols())
+            conn.executescript(SymbolDB.INDEXES)
+            conn.commit()
+        finally:
+            conn.close()
+
+    def __repr__(self):
+        return format_symbols(SymbolView(self.store, row) for scope in self.all_scopes for row in scope.rows)
+
+def format_symbols(entries: Iterable[SymbolEntry])->str:
+    lines = []
+    lines.append("======= Tabla de simbolos =======")
+    lines.append("Name | kind | type | addr | size | params | return | label")
+    lines.append("-"*90)
+    for e in entries:
+        lines.append(f"{e.name} | {e.sym_type} | {e.data_type} | {e.address} | {e.size} | {e.params} | {e.return_type} | {e.label}")
+    lines.append("="*90)
+    return "\n".join(lines)
+
+class SymbolDB:
+    # Lectura de una tabla exportada con SymbolTable.export_sqlite, sin
+    # volver a compilar. Las entradas se devuelven como SymbolEntry sueltos;
+    # symbols.id sigue el orden en que SymbolTable imprime la tabla.
+    SCHEMA = """
+        CREATE TABLE scopes (id INTEGER PRIMARY KEY, parent INTEGER, level INTEGER, kind TEXT,
+                             line INTEGER, col INTEGER, end_line INTEGER, end_col INTEGER, frame_size INTEGER);
+        CREATE TABLE symbols (id INTEGER PRIMARY KEY, name TEXT, kind TEXT, data_type TEXT, scope INTEGER,
+                              scope_level INTEGER, address INTEGER, size INTEGER, params BLOB,
+                              return_type TEXT, label TEXT, extra BLOB);
+    """
+    INDEXES = """
+        CREATE INDEX symbols_name ON symbols (name, scope);
+        CREATE INDEX symbols_kind ON symbols (kind);
+    """
+    FIELDS = "symbols.name, symbols.kind, data_type, scope_level, address, size, params, return_type, label, extra"
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise Exception(f"No existe la tabla exportada '{path}'")
+        self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self)->'SymbolDB':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self)->int:
+        return self.conn.execute("SELECT COUNT(*) FROM symbols").fetchone()[0]
+
+    @staticmethod
+    def _entry(r: Tuple)->SymbolEntry:
+        name, kind, data_type, level, address, size, params, return_type, label, extra = r
+        return SymbolEntry(name, kind, data_type, level, address, size,
+                           None if params is None else marshal.loads(params), return_type, label,
+                           None if extra is None else marshal.loads(extra))
 
     def lookup(self, name: str)->Optional[SymbolEntry]:
-        for s in reversed(self.scopes):
-            if name in s:
-                return s[name]
-        return None
+        # Como SymbolTable.lookup al terminar la compilacion: scope global
+        r = self.conn.execute(f"SELECT {self.FIELDS} FROM symbols WHERE name = ? AND scope = 0", (name,)).fetchone()
+        return None if r is None else self._entry(r)
+
+    def lookup_at(self, name: str, line: int, col: int)->Optional[SymbolEntry]:
+        # Declaracion del scope mas profundo que contiene la posicion
+        r = self.conn.execute(
+            f"SELECT {self.FIELDS} FROM symbols JOIN scopes ON scopes.id = symbols.scope"
+            " WHERE symbols.name = ? AND (scopes.id = 0 OR ((scopes.line, scopes.col) <= (?, ?)"
+            " AND (?, ?) < (scopes.end_line, scopes.end_col)))"
+            " ORDER BY scopes.level DESC LIMIT 1", (name, line, col, line, col)).fetchone()
+        return None if r is None else self._entry(r)
+
+    def of_kind(self, kind: str)->List[SymbolEntry]:
+        cur = self.conn.execute(f"SELECT {self.FIELDS} FROM symbols WHERE kind = ? ORDER BY id", (kind,))
+        return [self._entry(r) for r in cur]
 
     def __repr__(self):
-        lines = []
-        lines.append("======= Tabla de simbolos =======")
-        lines.append("Name | kind | type | addr | size | params | return | label")
-        lines.append("-"*90)
-        for i, scope in enumerate(self.scopes):
-            for e in scope.values():
-                lines.append(f"{e.name} | {e.sym_type} | {e.data_type} | {e.address} | {e.size} | {e.params} | {e.return_type} | {e.label}")
-        lines.append("="*90)
-        return "\n".join(lines)
+        return format_symbols(map(self._entry, self.conn.execute(f"SELECT {self.FIELDS} FROM symbols ORDER BY id")))
     # PARTE 2: Lexer y Parser
 
 class Lexer:
@@ -687,306 +1473,1695 @@ class Lexer:
         tokens.append(Token('EOF','',self.line,self.col))
         return tokens
 
+    def iter_tokens(self, stream: Optional[TextIO]=None, chunk_size: int=1 << 16)->Iterator[Token]:
+        # Genera los tokens a medida que lee `stream` por bloques (o self.text
+        # si no se pasa stream). Un token que toca el final del bloque puede
+        # continuar en el siguiente, asi que se espera a leer mas antes de emitirlo.
+        if stream is None:
+            chunks = iter((self.text,))
+        else:
+            chunks = iter(lambda: stream.read(chunk_size), '')
+        match = TOKEN_RE.match
+        buf = ''
+        pos = 0
+        line = self.line
+        line_start = 1 - self.col
+        eof = False
+        while True:
+            if pos >= len(buf) and eof:
+                break
+            m = match(buf, pos) if pos < len(buf) else None
+            if m is None or (m.end() == len(buf) and m.lastgroup != 'WS' and not eof):
+                chunk = next(chunks, '')
+                if not chunk:
+                    eof = True
+                buf = buf[pos:] + chunk
+                line_start -= pos
+                pos = 0
+                continue
+            kind = m.lastgroup
+            end = m.end()
+            if kind == 'WS':
+                nl = buf.count('\n', pos, end)
+                if nl:
+                    line += nl
+                    line_start = buf.rfind('\n', pos, end) + 1
+            else:
+                lex = m.group()
+                if kind == 'ID':
+                    kind = KEYWORDS.get(lex, 'ID')
+                elif kind == 'PUNCT':
+                    kind = PUNCT_TYPES[lex]
+                elif kind == 'ERR':
+                    raise _unexpected_char(lex, line, pos - line_start + 1)
+                yield Token(kind, lex, line, pos - line_start + 1)
+            pos = end
+        self.line, self.col = line, pos - line_start + 1
+        yield Token('EOF','',self.line,self.col)
+
+
+# Motor alternativo: un solo patron compilado recorre el texto por tokens
+# completos en vez de caracter a caracter. Produce la misma secuencia de
+# Token y los mismos errores que Lexer.tokenize.
+TOKEN_PATTERN = r"""
+    (?P<WS>[ \t\r\n]+)
+  | (?P<NUMBER>{digit}+(?:\.{digit}*)?)
+  | (?P<ID>{id_start}\w*)
+  | (?P<OP>==|!=|<=|>=|[<>+\-*/])
+  | (?P<ASSIGN>=)
+  | (?P<PUNCT>[(),;{{}}\[\]:.])
+  | (?P<ERR>.)
+"""
+
+def _char_ranges(chars: List[str])->str:
+    # Rangos \uXXXX / \U........ para una clase de caracteres a partir de una lista ordenada
+    def esc(c: str)->str:
+        n = ord(c)
+        return f"\\u{n:04x}" if n < 0x10000 else f"\\U{n:08x}"
+    out = []
+    i = 0
+    while i < len(chars):
+        j = i
+        while j + 1 < len(chars) and ord(chars[j + 1]) == ord(chars[j]) + 1:
+            j += 1
+        out.append(esc(chars[i]) + ('-' + esc(chars[j]) if j > i else ''))
+        i = j + 1
+    return ''.join(out)
+
+def _numeric_classes()->Tuple[str, str]:
+    # _DIGIT_EXTRA y _NUMERIC_NOT_ALPHA calculados recorriendo todo Unicode
+    # (unos 0.2 s); las pruebas los comparan con los de abajo para notar un
+    # cambio de version de Unicode en Python.
+    numeric = [c for c in map(chr, range(sys.maxunicode + 1)) if c.isnumeric()]
+    return (_char_ranges([c for c in numeric if c.isdigit() and not c.isdecimal()]),
+            _char_ranges([c for c in numeric if not c.isalpha()]))
+
+# \d solo cubre los decimales y \w incluye numeros que no son letras; Lexer
+# decide con isdigit/isalpha, asi que se agregan y quitan esos caracteres a
+# mano. Generados con _numeric_classes() sobre Unicode 14.0 (Python 3.11):
+# digitos que no son decimales, y numeros que no son letras.
+_DIGIT_EXTRA = (
+    r'\u00b2-\u00b3\u00b9\u1369-\u1371\u19da\u2070\u2074-\u2079\u2080-\u2089\u2460-\u2468'
+    r'\u2474-\u247c\u2488-\u2490\u24ea\u24f5-\u24fd\u24ff\u2776-\u277e\u2780-\u2788'
+    r'\u278a-\u2792\U00010a40-\U00010a43\U00010e60-\U00010e68\U00011052-\U0001105a'
+    r'\U0001f100-\U0001f10a')
+_NUMERIC_NOT_ALPHA = (
+    r'\u0030-\u0039\u00b2-\u00b3\u00b9\u00bc-\u00be\u0660-\u0669\u06f0-\u06f9\u07c0-\u07c9'
+    r'\u0966-\u096f\u09e6-\u09ef\u09f4-\u09f9\u0a66-\u0a6f\u0ae6-\u0aef\u0b66-\u0b6f'
+    r'\u0b72-\u0b77\u0be6-\u0bf2\u0c66-\u0c6f\u0c78-\u0c7e\u0ce6-\u0cef\u0d58-\u0d5e'
+    r'\u0d66-\u0d78\u0de6-\u0def\u0e50-\u0e59\u0ed0-\u0ed9\u0f20-\u0f33\u1040-\u1049'
+    r'\u1090-\u1099\u1369-\u137c\u16ee-\u16f0\u17e0-\u17e9\u17f0-\u17f9\u1810-\u1819'
+    r'\u1946-\u194f\u19d0-\u19da\u1a80-\u1a89\u1a90-\u1a99\u1b50-\u1b59\u1bb0-\u1bb9'
+    r'\u1c40-\u1c49\u1c50-\u1c59\u2070\u2074-\u2079\u2080-\u2089\u2150-\u2182\u2185-\u2189'
+    r'\u2460-\u249b\u24ea-\u24ff\u2776-\u2793\u2cfd\u3007\u3021-\u3029\u3038-\u303a'
+    r'\u3192-\u3195\u3220-\u3229\u3248-\u324f\u3251-\u325f\u3280-\u3289\u32b1-\u32bf'
+    r'\ua620-\ua629\ua6e6-\ua6ef\ua830-\ua835\ua8d0-\ua8d9\ua900-\ua909\ua9d0-\ua9d9'
+    r'\ua9f0-\ua9f9\uaa50-\uaa59\uabf0-\uabf9\uff10-\uff19\U00010107-\U00010133'
+    r'\U00010140-\U00010178\U0001018a-\U0001018b\U000102e1-\U000102fb\U00010320-\U00010323'
+    r'\U00010341\U0001034a\U000103d1-\U000103d5\U000104a0-\U000104a9\U00010858-\U0001085f'
+    r'\U00010879-\U0001087f\U000108a7-\U000108af\U000108fb-\U000108ff\U00010916-\U0001091b'
+    r'\U000109bc-\U000109bd\U000109c0-\U000109cf\U000109d2-\U000109ff\U00010a40-\U00010a48'
+    r'\U00010a7d-\U00010a7e\U00010a9d-\U00010a9f\U00010aeb-\U00010aef\U00010b58-\U00010b5f'
+    r'\U00010b78-\U00010b7f\U00010ba9-\U00010baf\U00010cfa-\U00010cff\U00010d30-\U00010d39'
+    r'\U00010e60-\U00010e7e\U00010f1d-\U00010f26\U00010f51-\U00010f54\U00010fc5-\U00010fcb'
+    r'\U00011052-\U0001106f\U000110f0-\U000110f9\U00011136-\U0001113f\U000111d0-\U000111d9'
+    r'\U000111e1-\U000111f4\U000112f0-\U000112f9\U00011450-\U00011459\U000114d0-\U000114d9'
+    r'\U00011650-\U00011659\U000116c0-\U000116c9\U00011730-\U0001173b\U000118e0-\U000118f2'
+    r'\U00011950-\U00011959\U00011c50-\U00011c6c\U00011d50-\U00011d59\U00011da0-\U00011da9'
+    r'\U00011fc0-\U00011fd4\U00012400-\U0001246e\U00016a60-\U00016a69\U00016ac0-\U00016ac9'
+    r'\U00016b50-\U00016b59\U00016b5b-\U00016b61\U00016e80-\U00016e96\U0001d2e0-\U0001d2f3'
+    r'\U0001d360-\U0001d378\U0001d7ce-\U0001d7ff\U0001e140-\U0001e149\U0001e2f0-\U0001e2f9'
+    r'\U0001e8c7-\U0001e8cf\U0001e950-\U0001e959\U0001ec71-\U0001ecab\U0001ecad-\U0001ecaf'
+    r'\U0001ecb1-\U0001ecb4\U0001ed01-\U0001ed2d\U0001ed2f-\U0001ed3d\U0001f100-\U0001f10c'
+    r'\U0001fbf0-\U0001fbf9')
+TOKEN_RE = re.compile(TOKEN_PATTERN.format(
+    digit='[\\d' + _DIGIT_EXTRA + ']', id_start='[^\\W' + _NUMERIC_NOT_ALPHA + ']'),
+    re.VERBOSE | re.DOTALL)
+
+PUNCT_TYPES = {
+    '(':'LPAREN',')':'RPAREN',',':'COMMA',';':'SEMICOLON',
+    '{':'LBRACE','}':'RBRACE','[':'LBRACK',']':'RBRACK',':':'COLON','.':'DOT'
+}
+
+# Version para fuentes bytes: las clases solo cubren ASCII. Un ID o NUMBER
+# pegado a un byte no ASCII (0x80-0xff, parte de un caracter UTF-8) no
+# coincide y cae en UTF8, que manda el resto de la linea a TOKEN_RE.
+TOKEN_RE_BYTES = re.compile(rb"""
+    (?P<WS>[ \t\r\n]+)
+  | (?P<NUMBER>(?>\d+(?:\.\d*)?)(?![\x80-\xff]))
+  | (?P<ID>(?>[^\W\d]\w*)(?![\x80-\xff]))
+  | (?P<OP>==|!=|<=|>=|[<>+\-*/])
+  | (?P<ASSIGN>=)
+  | (?P<PUNCT>[(),;{}\[\]:.])
+  | (?P<UTF8>[\w.]*[\x80-\xff])
+  | (?P<ERR>.)
+""", re.VERBOSE | re.DOTALL)
+
+BYTES_KEYWORDS = {k.encode('ascii'): k for k in KEYWORDS}
+BYTES_FIXED = {op.encode('ascii'): ('OP', op) for op in ('==','!=','<=','>=','<','>','+','-','*','/')}
+BYTES_FIXED[b'='] = ('ASSIGN', '=')
+BYTES_FIXED.update({c.encode('ascii'): (t, c) for c, t in PUNCT_TYPES.items()})
+
+def _unexpected_char(c: str, line: int, col: int)->Exception:
+    if c == '!':
+        return Exception(f"Caracter inesperado '!' en linea {line} col {col}")
+    return Exception(f"Caracter inesperado '{c}' en linea {line} columna {col}")
+
+class RegexLexer(Lexer):
+    def __init__(self, text: str, lazy_positions: bool=False, pool: Optional[StringPool]=None):
+        super().__init__(text)
+        self.lazy_positions = lazy_positions
+        self.pool = pool
+
+    def tokenize(self)->List[Token]:
+        if not isinstance(self.text, str):
+            return self._tokenize_bytes()
+        if self.lazy_positions:
+            return self._tokenize_lazy()
+        text = self.text
+        keywords = KEYWORDS
+        punct = PUNCT_TYPES
+        pool = self.pool
+        tokens: List[Token] = []
+        append = tokens.append
+        line = self.line
+        line_start = self.pos - (self.col - 1)
+        pos = self.pos
+        for m in TOKEN_RE.finditer(text, self.pos):
+            kind = m.lastgroup
+            pos = m.start()
+            if kind == 'WS':
+                end = m.end()
+                nl = text.count('\n', pos, end)
+                if nl:
+                    line += nl
+                    line_start = text.rfind('\n', pos, end) + 1
+                continue
+            lex = m.group()
+            if kind == 'ID':
+                kind = keywords.get(lex, 'ID')
+                if pool is not None and kind == 'ID':
+                    i = pool.intern(lex)
+                    append(Token(kind, pool.names[i], line, pos - line_start + 1, i))
+                    continue
+            elif kind == 'PUNCT':
+                kind = punct[lex]
+            elif kind == 'ERR':
+                raise _unexpected_char(lex, line, pos - line_start + 1)
+            append(Token(kind, lex, line, pos - line_start + 1))
+        self.pos = self.len
+        self.line, self.col = line, self.len - line_start + 1
+        append(Token('EOF','',self.line,self.col))
+        return tokens
+
+    def _tokenize_lazy(self)->List[Token]:
+        # Sin contar saltos de linea: cada token lleva su offset y las
+        # posiciones salen de un LineIndex compartido.
+        text = self.text
+        index = LineIndex(text)
+        keywords = KEYWORDS
+        punct = PUNCT_TYPES
+        pool = self.pool
+        tokens: List[Token] = []
+        append = tokens.append
+        for m in TOKEN_RE.finditer(text, self.pos):
+            kind = m.lastgroup
+            if kind == 'WS':
+                continue
+            lex = m.group()
+            if kind == 'ID':
+                kind = keywords.get(lex, 'ID')
+                if pool is not None and kind == 'ID':
+                    tok = LazyToken(kind, lex, m.start(), index)
+                    tok.ident = pool.intern(lex)
+                    tok.lexema = pool.names[tok.ident]
+                    append(tok)
+                    continue
+            elif kind == 'PUNCT':
+                kind = punct[lex]
+            elif kind == 'ERR':
+                raise _unexpected_char(lex, *index.position(m.start()))
+            append(LazyToken(kind, lex, m.start(), index))
+        self.pos = self.len
+        append(LazyToken('EOF', '', self.len, index))
+        return tokens
+
+    def _tokenize_bytes(self)->List[Token]:
+        # Fuente bytes-like (bytes, bytearray, mmap): se recorre en su sitio y
+        # los lexemas de ID/NUMBER son memoryview sobre el mismo buffer (str
+        # del pool si hay pool). Operadores, puntuacion y palabras clave usan
+        # las constantes str. Una linea con caracteres no ASCII se decodifica
+        # desde el primero de ellos, asi las columnas cuentan caracteres.
+        text = self.text
+        view = memoryview(text).toreadonly()
+        try:
+            hash(view[:0])
+            key = None
+        except (TypeError, ValueError):
+            # memoryview sobre un buffer mutable (bytearray) no es hashable
+            key = bytes
+        keywords = BYTES_KEYWORDS
+        fixed = BYTES_FIXED
+        pool = self.pool
+        idents: Dict[bytes, int] = {}
+        tokens: List[Token] = []
+        append = tokens.append
+        line = self.line
+        line_start = self.pos - (self.col - 1)
+        pos = self.pos
+        # bytes de mas respecto de caracteres en la linea actual
+        shift = 0
+        restart = True
+        while restart:
+            restart = False
+            for m in TOKEN_RE_BYTES.finditer(text, pos):
+                kind = m.lastgroup
+                pos, end = m.span()
+                if kind == 'WS':
+                    nl = text.find(b'\n', pos, end)
+                    while nl != -1:
+                        line += 1
+                        line_start = nl + 1
+                        shift = 0
+                        nl = text.find(b'\n', nl + 1, end)
+                    continue
+                col = pos - line_start + 1
+                if kind == 'ID':
+                    lex = view[pos:end]
+                    kw = keywords.get(lex if key is None else key(lex))
+                    if kw is not None:
+                        append(Token(KEYWORDS[kw], kw, line, col))
+                    elif pool is None:
+                        append(Token('ID', lex, line, col))
+                    else:
+                        i = idents.get(lex if key is None else key(lex))
+                        if i is None:
+                            i = idents[bytes(lex)] = pool.intern(str(lex, 'ascii'))
+                        append(Token('ID', pool.names[i], line, col, i))
+                elif kind == 'NUMBER':
+                    append(Token('NUMBER', view[pos:end], line, col))
+                elif kind == 'UTF8':
+                    # Antes de pos la linea es ASCII, asi que col ya esta en
+                    # caracteres; ningun token cruza el salto de linea.
+                    stop = text.find(b'\n', pos)
+                    if stop == -1:
+                        stop = self.len
+                    seg = str(view[pos:stop], 'utf-8', 'replace')
+                    for u in TOKEN_RE.finditer(seg):
+                        ukind = u.lastgroup
+                        if ukind == 'WS':
+                            continue
+                        lex = u.group()
+                        ucol = col + u.start()
+                        if ukind == 'ID':
+                            ukind = KEYWORDS.get(lex, 'ID')
+                            if pool is not None and ukind == 'ID':
+                                i = pool.intern(lex)
+                                append(Token(ukind, pool.names[i], line, ucol, i))
+                                continue
+                        elif ukind == 'PUNCT':
+                            ukind = PUNCT_TYPES[lex]
+                        elif ukind == 'ERR':
+                            raise _unexpected_char(lex, line, ucol)
+                        append(Token(ukind, lex, line, ucol))
+                    shift = stop - pos - len(seg)
+                    pos = stop
+                    restart = True
+                    break
+                elif kind == 'ERR':
+                    raise _unexpected_char(chr(text[pos]), line, col)
+                else:
+                    lex = view[pos:end]
+                    tipo, lex = fixed[lex if key is None else key(lex)]
+                    append(Token(tipo, lex, line, col))
+        self.pos = self.len
+        self.line, self.col = line, self.len - line_start - shift + 1
+        append(Token('EOF','',self.line,self.col))
+        return tokens
+
+
+def open_source(path: str):
+    # Mapea el archivo en memoria (solo lectura) para RegexLexer; un archivo
+    # vacio no se puede mapear y se devuelve como b''.
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return b''
+
+
+class IncrementalLexer:
+    # Mantiene los tokens de un buffer de editor en una TokenRope: bloques
+    # de block_lines lineas enteras, cada uno tokenizado por separado (ningun
+    # token cruza un salto de linea). edit() re-tokeniza solo los bloques que
+    # toca el cambio y arma una TokenRope nueva que comparte el resto, asi el
+    # costo depende del tamano del cambio y no del archivo, y las TokenRope
+    # devueltas antes no cambian.
+    def __init__(self, text: str, block_lines: int=16):
+        self.block_lines = block_lines
+        self.tokens = TokenRope.from_blocks(self._blocks(text))
+
+    @property
+    def text(self)->str:
+        return self.tokens.text
+
+    def _blocks(self, text: str, first_line: int=1)->List['TokenStream']:
+        # first_line solo sirve para que los errores den la linea real
+        blocks = []
+        start = 0
+        while start < len(text):
+            cut = start
+            for _ in range(self.block_lines):
+                cut = text.find('\n', cut) + 1
+                if not cut:
+                    cut = len(text)
+                    break
+            blocks.append(TokenStream.from_text(text[start:cut], first_line))
+            first_line += text.count('\n', start, cut)
+            start = cut
+        return blocks
+
+    def edit(self, start: int, end: int, replacement: str)->'TokenRope':
+        rope = self.tokens
+        first = rope.locate(start)
+        last = rope.locate(end - 1) if end > start else first
+        off, line = rope.block_start(*first)
+        parts = []
+        at = first
+        while True:
+            parts.append(rope.groups[at[0]][0][at[1]].text)
+            if at == last:
+                break
+            at = rope.next_block(*at)
+        region = ''.join(parts)
+        text = region[:start - off] + replacement + region[end - off:]
+        # si el cambio se comio el ultimo salto de linea, la linea sigue en
+        # el bloque de al lado
+        while not text.endswith('\n'):
+            nxt = rope.next_block(*last)
+            if nxt is None:
+                break
+            last = nxt
+            text += rope.groups[last[0]][0][last[1]].text
+        self.tokens = rope.splice(first, last, self._blocks(text, line + 1))
+        return self.tokens
+
+TOKEN_TYPES = [
+    'EOF','ID','NUMBER','OP','ASSIGN','LPAREN','RPAREN','COMMA','SEMICOLON',
+    'LBRACE','RBRACE','LBRACK','RBRACK','COLON','DOT'
+] + list(KEYWORDS.values())
+TOKEN_CODES = {t: i for i, t in enumerate(TOKEN_TYPES)}
+
+class TokenStream:
+    # Tokens guardados en columnas array('i') en lugar de un Token por
+    # elemento; el lexema se recorta del texto fuente solo al indexar.
+    def __init__(self, text: str):
+        self.text = text
+        self.first_line = 1
+        self.types = array('i')
+        self.starts = array('i')
+        self.ends = array('i')
+        self.lines = array('i')
+        self.cols = array('i')
+
+    @classmethod
+    def from_text(cls, text: str, first_line: int=1)->'TokenStream':
+        ts = cls(text)
+        ts.first_line = first_line
+        codes = TOKEN_CODES
+        keywords = KEYWORDS
+        punct = PUNCT_TYPES
+        add_type, add_start, add_end = ts.types.append, ts.starts.append, ts.ends.append
+        add_line, add_col = ts.lines.append, ts.cols.append
+        line = first_line
+        line_start = 0
+        for m in TOKEN_RE.finditer(text):
+            kind = m.lastgroup
+            pos, end = m.span()
+            if kind == 'WS':
+                nl = text.count('\n', pos, end)
+                if nl:
+                    line += nl
+                    line_start = text.rfind('\n', pos, end) + 1
+                continue
+            if kind == 'ID':
+                kind = keywords.get(m.group(), 'ID')
+            elif kind == 'PUNCT':
+                kind = punct[m.group()]
+            elif kind == 'ERR':
+                raise _unexpected_char(m.group(), line, pos - line_start + 1)
+            add_type(codes[kind]); add_start(pos); add_end(end)
+            add_line(line); add_col(pos - line_start + 1)
+        n = len(text)
+        add_type(codes['EOF']); add_start(n); add_end(n)
+        add_line(line); add_col(n - line_start + 1)
+        return ts
+
+    def __len__(self)->int:
+        return len(self.types)
+
+    def __getitem__(self, i: int)->Token:
+        return Token(TOKEN_TYPES[self.types[i]], self.text[self.starts[i]:self.ends[i]],
+                     self.lines[i], self.cols[i])
+
+    def __iter__(self)->Iterator[Token]:
+        for i in range(len(self.types)):
+            yield self[i]
+
+    def nbytes(self)->int:
+        return sum(a.itemsize * len(a) for a in (self.types, self.starts, self.ends, self.lines, self.cols))
+
+class TokenRope:
+    # Secuencia de tokens inmutable hecha de TokenStream por bloques de
+    # lineas enteras. Cada bloque guarda lineas desde su first_line y
+    # offsets propios, y los bloques van en grupos de a lo sumo 2*GROUP con
+    # los acumulados de caracteres, saltos de linea y tokens del grupo; la
+    # posicion absoluta de un token sale de sumar el acumulado del grupo y
+    # el del bloque. splice() copia solo los grupos que cambian, asi una
+    # TokenRope vieja sigue valiendo y comparte el resto. Se indexa como una
+    # lista de Token, con el EOF al final.
+    GROUP = 64
+
+    def __init__(self, groups: List[Tuple[List[TokenStream], array, array, array]]):
+        self.groups = groups
+        self.char_base = array('i', accumulate((g[1][-1] for g in groups), initial=0))
+        self.line_base = array('i', accumulate((g[2][-1] for g in groups), initial=0))
+        self.token_base = array('i', accumulate((g[3][-1] for g in groups), initial=0))
+
+    @classmethod
+    def from_blocks(cls, blocks: List[TokenStream])->'TokenRope':
+        if not blocks:
+            blocks = [TokenStream.from_text('')]
+        n = cls.GROUP
+        return cls([cls._group(blocks[i:i + n]) for i in range(0, len(blocks), n)])
+
+    @staticmethod
+    def _group(blocks: List[TokenStream])->Tuple[List[TokenStream], array, array, array]:
+        return (blocks,
+                array('i', accumulate((len(b.text) for b in blocks), initial=0)),
+                array('i', accumulate((b.lines[-1] - b.first_line for b in blocks), initial=0)),
+                array('i', accumulate((len(b) - 1 for b in blocks), initial=0)))
+
+    @property
+    def blocks(self)->List[TokenStream]:
+        return [b for g in self.groups for b in g[0]]
+
+    @property
+    def text(self)->str:
+        return ''.join(b.text for g in self.groups for b in g[0])
+
+    def locate(self, offset: int)->Tuple[int, int]:
+        # (grupo, bloque) que contiene el caracter offset; el ultimo si se pasa
+        g = min(bisect_right(self.char_base, offset), len(self.groups)) - 1
+        chars = self.groups[g][1]
+        k = min(bisect_right(chars, offset - self.char_base[g]), len(chars) - 1) - 1
+        return g, k
+
+    def block_start(self, g: int, k: int)->Tuple[int, int]:
+        # offset y numero de linea (desde 0) donde empieza el bloque
+        group = self.groups[g]
+        return self.char_base[g] + group[1][k], self.line_base[g] + group[2][k]
+
+    def next_block(self, g: int, k: int)->Optional[Tuple[int, int]]:
+        if k + 1 < len(self.groups[g][0]):
+            return g, k + 1
+        if g + 1 < len(self.groups):
+            return g + 1, 0
+        return None
+
+    def splice(self, first: Tuple[int, int], last: Tuple[int, int], fresh: List[TokenStream])->'TokenRope':
+        # Nueva TokenRope con los bloques de first a last (inclusive)
+        # cambiados por fresh; los grupos del medio se rearman.
+        (g, a), (h, b) = first, last
+        groups = self.groups
+        blocks = groups[g][0][:a] + fresh + groups[h][0][b + 1:]
+        n = self.GROUP
+        if len(blocks) > 2 * n:
+            middle = [self._group(blocks[i:i + n]) for i in range(0, len(blocks), n)]
+        else:
+            middle = [self._group(blocks)] if blocks else []
+        result = groups[:g] + middle + groups[h + 1:]
+        if not result:
+            return TokenRope.from_blocks([])
+        return TokenRope(result)
+
+    def __len__(self)->int:
+        return self.token_base[-1] + 1
+
+    def _token(self, g: int, k: int, i: int)->Token:
+        blocks, _, lines, _ = self.groups[g]
+        b = blocks[k]
+        line = self.line_base[g] + lines[k] + b.lines[i] - b.first_line + 1
+        return Token(TOKEN_TYPES[b.types[i]], b.text[b.starts[i]:b.ends[i]], line, b.cols[i])
+
+    def __getitem__(self, i: int)->Token:
+        n = self.token_base[-1]
+        if i < 0:
+            i += n + 1
+        if not 0 <= i <= n:
+            raise IndexError('indice de token fuera de rango')
+        if i == n:
+            g = len(self.groups) - 1
+            k = len(self.groups[g][0]) - 1
+            return self._token(g, k, len(self.groups[g][0][k]) - 1)
+        g = bisect_right(self.token_base, i) - 1
+        i -= self.token_base[g]
+        counts = self.groups[g][3]
+        k = bisect_right(counts, i) - 1
+        return self._token(g, k, i - counts[k])
+
+    def __iter__(self)->Iterator[Token]:
+        for g, group in enumerate(self.groups):
+            for k, b in enumerate(group[0]):
+                for i in range(len(b) - 1):
+                    yield self._token(g, k, i)
+        yield self[-1]
+
+def _lex_chunk(args: Tuple[str, int, int])->Tuple[array, array, array, array, array]:
+    # Columnas de un trozo con los offsets ya corridos a la fuente completa
+    text, first_line, base = args
+    ts = TokenStream.from_text(text, first_line)
+    if base:
+        ts.starts = array('i', [x + base for x in ts.starts])
+        ts.ends = array('i', [x + base for x in ts.ends])
+    return ts.types, ts.starts, ts.ends, ts.lines, ts.cols
+
+def tokenize_parallel(text: str, workers: Optional[int]=None, min_chunk: int=1 << 18)->TokenStream:
+    # Corta el texto en saltos de linea (ningun token los cruza), tokeniza
+    # cada trozo en un proceso y concatena las columnas en un TokenStream
+    # sobre el texto completo; cada trozo pierde su EOF salvo el ultimo. La
+    # secuencia de tokens es igual a la de Lexer.tokenize.
+    workers = workers or os.cpu_count() or 1
+    target = max(min_chunk, len(text) // (workers * 4) + 1)
+    chunks: List[Tuple[str, int, int]] = []
+    start, line = 0, 1
+    while start < len(text):
+        cut = text.find('\n', start + target)
+        cut = len(text) if cut == -1 else cut + 1
+        chunks.append((text[start:cut], line, start))
+        line += text.count('\n', start, cut)
+        start = cut
+    if workers == 1 or len(chunks) <= 1:
+        return TokenStream.from_text(text)
+
+    ts = TokenStream(text)
+    columns = (ts.types, ts.starts, ts.ends, ts.lines, ts.cols)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_lex_chunk, chunks):
+            for column, part in zip(columns, result):
+                column.extend(part)
+                column.pop()
+    for column, part in zip(columns, result):
+        column.append(part[-1])
+    return ts
+
+LEXERS = {'clasico': Lexer, 'regex': RegexLexer}
+
+
+class TokenBuffer:
+    # Fuente de tokens para Parser sobre un iterador: solo guarda una ventana
+    # circular de `size` tokens alrededor de la posicion actual.
+    def __init__(self, tokens: Iterable[Token], size: int=4):
+        self._it = iter(tokens)
+        self._buf: deque = deque(maxlen=size)
+        self._base = 0
+        self._eof: Optional[Token] = None
+
+    def __getitem__(self, i: int)->Token:
+        buf = self._buf
+        while i >= self._base + len(buf):
+            if self._eof is not None:
+                return self._eof
+            tok = next(self._it)
+            if len(buf) == buf.maxlen:
+                self._base += 1
+            buf.append(tok)
+            if tok.tipo == 'EOF':
+                self._eof = tok
+        if i < self._base:
+            raise IndexError(f"Token {i} ya no esta en el buffer")
+        return buf[i - self._base]
+
+
+def run_stack(task):
+    # Ejecuta una tarea: un valor ya calculado o un generador que pide
+    # sub-tareas con `valor = yield subtarea`. Los generadores pendientes se
+    # guardan en una lista en lugar de la pila de llamadas de Python, de modo
+    # que el anidamiento no esta limitado por sys.getrecursionlimit(). Las
+    # excepciones de una sub-tarea se relanzan dentro de quien la pidio.
+    if task.__class__ is not GeneratorType:
+        return task
+    stack = [task]
+    value = None
+    error = None
+    while stack:
+        top = stack[-1]
+        try:
+            if error is None:
+                sub = top.send(value)
+            else:
+                exc, error = error, None
+                sub = top.throw(exc)
+        except StopIteration as stop:
+            stack.pop()
+            value = stop.value
+            continue
+        except Exception as exc:
+            stack.pop()
+            if not stack:
+                raise
+            error = exc
+            continue
+        if sub.__class__ is GeneratorType:
+            stack.append(sub)
+            value = None
+        else:
+            value = sub
+    return value
+
 
-class ParserError(Exception): pass
+class ParserError(Exception):
+    def __init__(self, msg: str, linea: Optional[int]=None, columna: Optional[int]=None):
+        super().__init__(msg)
+        self.linea = linea
+        self.columna = columna
+
+# Operadores binarios de expresion: mayor numero liga mas fuerte
+BINARY_PRECEDENCE = {
+    '==': 1, '!=': 1, '<': 1, '>': 1, '<=': 1, '>=': 1,
+    '+': 2, '-': 2,
+    '*': 3, '/': 3,
+}
+RIGHT_ASSOC = frozenset()
+UNARY_OPS = frozenset(('+', '-'))
+
+# Tokens donde el modo de recuperacion vuelve a sincronizar
+SYNC_DECLS = ('CONST','FUNCTION','PROCEDURE','ARRAY','TYPE')
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
+    def __init__(self, tokens: List[Token], recover: bool=False, lazy_bodies: bool=False,
+                 ids: Optional[IdAllocator]=None, exprs: Optional[ExprFactory]=None,
+                 positions: Optional[bool]=None):
+        # Con recover=True los errores se acumulan en self.errors y el
+        # parser sigue desde el siguiente punto de sincronizacion.
+        # Con lazy_bodies=True los cuerpos de funciones y procedimientos solo
+        # se saltan y se parsean la primera vez que se lee su .body.
+        # Con positions=False los nodos no guardan pos/param_pos (no hay
+        # referencias cruzadas) y ExprFactory puede compartir los nombres;
+        # por defecto es False solo si hay ExprFactory (ver ExprFactory).
+        if lazy_bodies and isinstance(tokens, TokenBuffer):
+            raise Exception("lazy_bodies necesita una lista de tokens o un TokenStream")
         self.tokens = tokens
         self.pos = 0
+        self.recover = recover
+        self.lazy_bodies = lazy_bodies
+        self.ids = ids if ids is not None else IdAllocator()
+        self.exprs = exprs
+        self.positions = exprs is None if positions is None else positions
+        self.errors: List[ParserError] = []
+
+    # Las reglas anidables se escriben como tareas para run_stack: devuelven
+    # el nodo ya construido o un generador que pide sub-reglas con
+    # `nodo = yield self._parse_x()`. Asi la profundidad de anidamiento del
+    # programa no consume pila de Python.
 
     def current(self)->Token:
         return self.tokens[self.pos]
 
+    @staticmethod
+    def _where(tok: Token):
+        # Con LazyToken se guarda el token: linea y columna se buscan solo si
+        # alguien pide la posicion (ver _position)
+        return tok if tok.__class__ is LazyToken else (tok.linea, tok.columna)
+
+    def _new(self, node: ASTNode, tok: Optional[Token]=None):
+        # Los ids se dan en orden de construccion, igual que siempre. Con
+        # ExprFactory una expresion repetida devuelve la instancia anterior
+        # y no consume id. tok es el token del nombre del nodo; si se anotan
+        # posiciones ese nodo no se comparte.
+        if tok is not None:
+            if self.positions:
+                node.pos = tok if tok.__class__ is LazyToken else (tok.linea, tok.columna)
+            if tok.ident is not None and isinstance(node, Expr):
+                node.name_id = tok.ident
+        if self.exprs is not None and isinstance(node, Expr) and (tok is None or not self.positions):
+            shared = self.exprs.intern(node)
+            if shared is not None:
+                return shared
+        node.id = self.ids.take()
+        return node
+
+    def peek(self)->Token:
+        try:
+            return self.tokens[self.pos+1]
+        except IndexError:
+            t = self.current()
+            return Token('EOF','',t.linea,t.columna)
+
     def eat(self, tipo: str)->Token:
         cur = self.current()
         if cur.tipo == tipo:
             self.pos += 1
             return cur
-        raise ParserError(f"Esperaba {tipo} pero vino {cur.tipo} en linea {cur.linea} columna {cur.columna}")
+        raise ParserError(f"Esperaba {tipo} pero vino {cur.tipo} en linea {cur.linea} columna {cur.columna}", cur.linea, cur.columna)
 
     def parse(self)->Program:
         decls = []
         while self.current().tipo != 'EOF':
-            decls.append(self.parse_decl_or_stmt())
-        return Program(decls)
+            if not self.recover:
+                decls.append(run_stack(self._parse_decl_or_stmt()))
+                continue
+            start = self.pos
+            try:
+                decls.append(run_stack(self._parse_decl_or_stmt()))
+            except ParserError as e:
+                self.errors.append(e)
+                self.synchronize(start)
+        return self._new(Program(decls, self.ids))
+
+    def parse_parallel(self, workers: Optional[int]=None, min_tokens: int=1 << 14)->Program:
+        # Corta los tokens en fronteras de declaraciones de nivel superior,
+        # parsea cada trozo en un proceso y arma sus nodos con los ids
+        # corridos por los nodos de los trozos anteriores, asi los ids
+        # coinciden con parse().
+        # Si un trozo tiene errores se repite todo con parse() para que se
+        # reporten igual que en serie. Con ExprFactory tambien se parsea en
+        # serie: los procesos no pueden compartir nodos.
+        if isinstance(self.tokens, TokenBuffer):
+            raise Exception("parse_parallel necesita una lista de tokens o un TokenStream")
+        workers = workers or os.cpu_count() or 1
+        tokens = self.tokens
+        ends = _top_level_ends(tokens, self.pos)
+        if workers == 1 or not ends or self.exprs is not None:
+            return self.parse()
+        target = max(min_tokens, (ends[-1] - self.pos) // (workers * 4) + 1)
+        chunks: List[Tuple[int, int]] = []
+        start = self.pos
+        for end in ends:
+            if end - start >= target:
+                chunks.append((start, end))
+                start = end
+        if start < ends[-1]:
+            chunks.append((start, ends[-1]))
+        if len(chunks) <= 1:
+            return self.parse()
+
+        jobs = []
+        for a, b in chunks:
+            rows = [(t.tipo, t.texto, t.linea, t.columna, t.ident) for t in (tokens[k] for k in range(a, b))]
+            nxt = tokens[b]
+            rows.append(('EOF', '', nxt.linea, nxt.columna, None))
+            jobs.append((rows, self.positions))
+        offset = self.ids.next
+        decls: List[Decl] = []
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for flat, count in pool.map(_parse_chunk, jobs):
+                    if flat is None:
+                        break
+                    decls.extend(flat.to_tree(offset).decls)
+                    offset += count
+        finally:
+            if enabled:
+                gc.enable()
+        if flat is None:
+            return self.parse()
+        self.ids.next = offset
+        self.pos = ends[-1]
+        return self._new(Program(decls, self.ids))
 
     def parse_decl_or_stmt(self):
+        return run_stack(self._parse_decl_or_stmt())
+
+    def parse_stmt_list(self)->List[Stmt]:
+        return run_stack(self._parse_stmt_list())
+
+    def parse_statement(self)->Stmt:
+        return run_stack(self._parse_statement())
+
+    def parse_expr(self, min_prec: int=1)->Expr:
+        return run_stack(self._parse_expr(min_prec))
+
+    def _parse_stmt_list(self):
+        stmts = []
+        while self.current().tipo != 'RBRACE':
+            if not self.recover:
+                stmts.append((yield self._parse_statement()))
+                continue
+            start = self.pos
+            try:
+                stmts.append((yield self._parse_statement()))
+            except ParserError as e:
+                self.errors.append(e)
+                tipo = self.current().tipo
+                if self.pos == start and (tipo == 'EOF' or tipo in SYNC_DECLS):
+                    # probablemente falta la '}' del bloque
+                    break
+                self.synchronize(start, in_block=True)
+        return stmts
+
+    def close_block(self):
+        # En modo recuperacion una '}' que falta se reporta sin abandonar el
+        # bloque, asi la declaracion que lo contiene queda en el Program.
+        if self.recover and self.current().tipo != 'RBRACE':
+            cur = self.current()
+            last = self.errors[-1] if self.errors else None
+            if last is None or (last.linea, last.columna) != (cur.linea, cur.columna):
+                self.errors.append(ParserError(f"Esperaba RBRACE pero vino {cur.tipo} en linea {cur.linea} columna {cur.columna}", cur.linea, cur.columna))
+            return
+        self.eat('RBRACE')
+
+    def _defer_body(self):
+        # Salta el cuerpo ya abierto balanceando llaves y devuelve la funcion
+        # que lo parsea mas tarde. Si el cuerpo no cierra devuelve None y se
+        # parsea en el momento para que el error salga en su sitio.
+        tokens = self.tokens
+        start = i = self.pos
+        depth = 1
+        try:
+            while True:
+                tipo = tokens[i].tipo
+                if tipo == 'RBRACE':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                elif tipo == 'LBRACE':
+                    depth += 1
+                elif tipo == 'EOF':
+                    return None
+                i += 1
+        except IndexError:
+            return None
+        self.pos = i + 1
+
+        def parse_body()->List[Stmt]:
+            sub = Parser(tokens, self.recover, ids=self.ids, exprs=self.exprs, positions=self.positions)
+            sub.pos = start
+            sub.errors = self.errors
+            return run_stack(sub._parse_stmt_list())
+        return parse_body
+
+    def synchronize(self, start: int, in_block: bool=False):
+        # Descarta tokens hasta despues de ';', hasta '}' (que se consume solo
+        # fuera de un bloque) o hasta una palabra de declaracion. Siempre
+        # avanza al menos un token para no repetir el mismo error.
+        while True:
+            tipo = self.current().tipo
+            if tipo == 'EOF':
+                return
+            if tipo == 'SEMICOLON':
+                self.pos += 1
+                return
+            if tipo == 'RBRACE':
+                if not in_block:
+                    self.pos += 1
+                return
+            if tipo in SYNC_DECLS and self.pos > start:
+                return
+            self.pos += 1
+
+    def _parse_decl_or_stmt(self):
         t = self.current()
         if t.tipo == 'CONST':
-            return self.parse_const_decl()
+            return self._parse_const_decl()
         if t.tipo == 'FUNCTION':
-            return self.parse_function_decl()
+            return self._parse_function_decl()
         if t.tipo == 'PROCEDURE':
-            return self.parse_procedure_decl()
+            return self._parse_procedure_decl()
         if t.tipo == 'ARRAY':
             return self.parse_array_decl()
         if t.tipo == 'TYPE':
             return self.parse_type_decl()
         if t.tipo in ('IF','WHILE','RETURN','LBRACE'):
-            return self.parse_statement()
+            return self._parse_statement()
         if t.tipo == 'ID':
-            nxt = self.tokens[self.pos+1] if (self.pos+1) < len(self.tokens) else Token('EOF','',t.linea,t.columna)
+            nxt = self.peek()
             if nxt.tipo == 'LPAREN':
-                return self.parse_statement()
-            return self.parse_statement()
-        raise ParserError(f"Declaracion/Stmt inesperado: {t}")
+                return self._parse_statement()
+            return self._parse_statement()
+        raise ParserError(f"Declaracion/Stmt inesperado: {t}", t.linea, t.columna)
 
-    def parse_const_decl(self):
+    def _parse_const_decl(self):
         self.eat('CONST')
-        name = self.eat('ID').lexema
+        name_tok = self.eat('ID')
         self.eat('ASSIGN')
-        val = self.parse_expr()
+        val = yield self._parse_expr()
         self.eat('SEMICOLON')
-        return ConstDecl(name, val)
+        return self._new(ConstDecl(name_tok.texto, val), name_tok)
 
     def parse_array_decl(self):
         self.eat('ARRAY')
-        name = self.eat('ID').lexema
+        name_tok = self.eat('ID')
         self.eat('LBRACK')
         size_tok = self.eat('NUMBER')
         self.eat('RBRACK')
         self.eat('SEMICOLON')
-        return ArrayDecl(name, int(size_tok.lexema))
+        return self._new(ArrayDecl(name_tok.texto, int(size_tok.texto)), name_tok)
 
     def parse_type_decl(self):
         self.eat('TYPE')
-        name = self.eat('ID').lexema
+        name_tok = self.eat('ID')
+        name = name_tok.texto
         self.eat('LBRACE')
         fields = []
         while self.current().tipo != 'RBRACE':
-            f = self.eat('ID').lexema
+            f = self.eat('ID').texto
             self.eat('SEMICOLON')
             fields.append((f, None))
         self.eat('RBRACE')
-        return TypeDecl(name, fields)
+        return self._new(TypeDecl(name, fields), name_tok)
+
+    def _span(self, start: Token)->Tuple[int,int,int,int]:
+        # Desde el inicio de start hasta el final del ultimo token consumido
+        end = self.tokens[self.pos - 1]
+        return (start.linea, start.columna, end.linea, end.columna + len(end.lexema))
 
-    def parse_function_decl(self):
-        self.eat('FUNCTION')
-        name = self.eat('ID').lexema
+    def _parse_params(self)->Tuple[List[Tuple[str,str]], List[Tuple[int,int]]]:
         self.eat('LPAREN')
-        params = []
+        params, param_pos = [], []
+        where = self._where if self.positions else None
         if self.current().tipo != 'RPAREN':
-            pname = self.eat('ID').lexema
-            params.append((pname, None))
+            ptok = self.eat('ID')
+            params.append((ptok.texto, None))
+            if where:
+                param_pos.append(where(ptok))
             while self.current().tipo == 'COMMA':
                 self.eat('COMMA')
-                pname = self.eat('ID').lexema
-                params.append((pname, None))
+                ptok = self.eat('ID')
+                params.append((ptok.texto, None))
+                if where:
+                    param_pos.append(where(ptok))
         self.eat('RPAREN')
+        return params, param_pos
+
+    def _parse_function_decl(self):
+        start = self.eat('FUNCTION')
+        name_tok = self.eat('ID')
+        name = name_tok.texto
+        params, param_pos = self._parse_params()
         self.eat('LBRACE')
-        stmts = []
-        while self.current().tipo != 'RBRACE':
-            stmts.append(self.parse_statement())
-        self.eat('RBRACE')
-        return FunctionDecl(name, params, None, stmts)
+        deferred = self._defer_body() if self.lazy_bodies else None
+        if deferred is not None:
+            node = self._new(FunctionDecl(name, params, None, None, self._span(start)), name_tok)
+            node._lazy = deferred
+        else:
+            stmts = yield self._parse_stmt_list()
+            self.close_block()
+            node = self._new(FunctionDecl(name, params, None, stmts, self._span(start)), name_tok)
+        node.param_pos = param_pos
+        return node
 
-    def parse_procedure_decl(self):
-        self.eat('PROCEDURE')
-        name = self.eat('ID').lexema
-        self.eat('LPAREN')
-        params = []
-        if self.current().tipo != 'RPAREN':
-            pname = self.eat('ID').lexema
-            params.append((pname, None))
-            while self.current().tipo == 'COMMA':
-                self.eat('COMMA')
-                pname = self.eat('ID').lexema
-                params.append((pname, None))
-        self.eat('RPAREN')
+    def _parse_procedure_decl(self):
+        start = self.eat('PROCEDURE')
+        name_tok = self.eat('ID')
+        name = name_tok.texto
+        params, param_pos = self._parse_params()
         self.eat('LBRACE')
-        stmts = []
-        while self.current().tipo != 'RBRACE':
-            stmts.append(self.parse_statement())
-        self.eat('RBRACE')
-        return ProcedureDecl(name, params, stmts)
+        deferred = self._defer_body() if self.lazy_bodies else None
+        if deferred is not None:
+            node = self._new(ProcedureDecl(name, params, None, self._span(start)), name_tok)
+            node._lazy = deferred
+        else:
+            stmts = yield self._parse_stmt_list()
+            self.close_block()
+            node = self._new(ProcedureDecl(name, params, stmts, self._span(start)), name_tok)
+        node.param_pos = param_pos
+        return node
 
-    def parse_statement(self)->Stmt:
+    def _parse_statement(self):
         t = self.current()
         if t.tipo == 'IF':
-            return self.parse_if()
+            return self._parse_if()
         if t.tipo == 'WHILE':
-            return self.parse_while()
+            return self._parse_while()
         if t.tipo == 'RETURN':
-            self.eat('RETURN')
-            if self.current().tipo != 'SEMICOLON':
-                e = self.parse_expr()
-            else:
-                e = None
-            self.eat('SEMICOLON')
-            return Return(e)
+            return self._parse_return()
         if t.tipo == 'LBRACE':
-            self.eat('LBRACE')
-            stmts = []
-            while self.current().tipo != 'RBRACE':
-                stmts.append(self.parse_statement())
-            self.eat('RBRACE')
-            node = ExprStmt(Number(0))
-            node.block = stmts
-            return node
+            return self._parse_block()
         if t.tipo == 'ID':
-            ident_tok = self.eat('ID')
-            cur = self.current()
-            if cur.tipo == 'ASSIGN':
-                self.eat('ASSIGN')
-                expr = self.parse_expr()
-                self.eat('SEMICOLON')
-                return Assign(Var(ident_tok.lexema), expr)
-            elif cur.tipo == 'LBRACK':
-                self.eat('LBRACK')
-                idx = self.parse_expr()
-                self.eat('RBRACK')
-                self.eat('ASSIGN')
-                expr = self.parse_expr()
-                self.eat('SEMICOLON')
-                return Assign(ArrayAccess(ident_tok.lexema, idx), expr)
-            elif cur.tipo == 'DOT':
-                self.eat('DOT')
-                field = self.eat('ID').lexema
-                self.eat('ASSIGN')
-                expr = self.parse_expr()
-                self.eat('SEMICOLON')
-                return Assign(FieldAccess(Var(ident_tok.lexema), field), expr)
-            elif cur.tipo == 'LPAREN':
-                call = self.parse_call_with_name(ident_tok.lexema)
-                self.eat('SEMICOLON')
-                return ExprStmt(call)
-            else:
-                raise ParserError(f"Esperaba ASSIGN, LPAREN, LBRACK o DOT despues de ID en linea {cur.linea} col {cur.columna}")
-        raise ParserError(f"Statement invalido en {t}")
+            return self._parse_id_statement()
+        raise ParserError(f"Statement invalido en {t}", t.linea, t.columna)
 
-    def parse_if(self)->If:
+    def _parse_return(self):
+        self.eat('RETURN')
+        if self.current().tipo != 'SEMICOLON':
+            e = yield self._parse_expr()
+        else:
+            e = None
+        self.eat('SEMICOLON')
+        return self._new(Return(e))
+
+    def _parse_block(self):
+        self.eat('LBRACE')
+        stmts = yield self._parse_stmt_list()
+        self.close_block()
+        node = self._new(ExprStmt(self._new(Number(0))))
+        node.block = stmts
+        return node
+
+    def _parse_id_statement(self):
+        ident_tok = self.eat('ID')
+        cur = self.current()
+        if cur.tipo == 'ASSIGN':
+            self.eat('ASSIGN')
+            expr = yield self._parse_expr()
+            self.eat('SEMICOLON')
+            return self._new(Assign(self._new(Var(ident_tok.texto), ident_tok), expr))
+        elif cur.tipo == 'LBRACK':
+            self.eat('LBRACK')
+            idx = yield self._parse_expr()
+            self.eat('RBRACK')
+            self.eat('ASSIGN')
+            expr = yield self._parse_expr()
+            self.eat('SEMICOLON')
+            return self._new(Assign(self._new(ArrayAccess(ident_tok.texto, idx), ident_tok), expr))
+        elif cur.tipo == 'DOT':
+            self.eat('DOT')
+            field = self.eat('ID').texto
+            self.eat('ASSIGN')
+            expr = yield self._parse_expr()
+            self.eat('SEMICOLON')
+            return self._new(Assign(self._new(FieldAccess(self._new(Var(ident_tok.texto), ident_tok), field)), expr))
+        elif cur.tipo == 'LPAREN':
+            call = yield self._parse_call_with_name(ident_tok)
+            self.eat('SEMICOLON')
+            return self._new(ExprStmt(call))
+        else:
+            raise ParserError(f"Esperaba ASSIGN, LPAREN, LBRACK o DOT despues de ID en linea {cur.linea} col {cur.columna}", cur.linea, cur.columna)
+
+    def _parse_if(self):
         self.eat('IF')
         self.eat('LPAREN')
-        cond = self.parse_expr()
+        cond = yield self._parse_expr()
         self.eat('RPAREN')
-        then_block = []
-        if self.current().tipo == 'LBRACE':
+        start = self.current()
+        if start.tipo == 'LBRACE':
             self.eat('LBRACE')
-            while self.current().tipo != 'RBRACE':
-                then_block.append(self.parse_statement())
-            self.eat('RBRACE')
+            then_block = yield self._parse_stmt_list()
+            self.close_block()
         else:
-            then_block.append(self.parse_statement())
-        else_block = None
+            then_block = [(yield self._parse_statement())]
+        then_span = self._span(start)
+        else_block = else_span = None
         if self.current().tipo == 'ELSE':
             self.eat('ELSE')
-            if self.current().tipo == 'LBRACE':
+            start = self.current()
+            if start.tipo == 'LBRACE':
                 self.eat('LBRACE')
-                else_block = []
-                while self.current().tipo != 'RBRACE':
-                    else_block.append(self.parse_statement())
-                self.eat('RBRACE')
+                else_block = yield self._parse_stmt_list()
+                self.close_block()
             else:
-                else_block = [self.parse_statement()]
-        return If(cond, then_block, else_block)
+                else_block = [(yield self._parse_statement())]
+            else_span = self._span(start)
+        return self._new(If(cond, then_block, else_block, then_span, else_span))
 
-    def parse_while(self)->While:
+    def _parse_while(self):
         self.eat('WHILE')
         self.eat('LPAREN')
-        cond = self.parse_expr()
+        cond = yield self._parse_expr()
         self.eat('RPAREN')
-        self.eat('LBRACE')
-        body = []
-        while self.current().tipo != 'RBRACE':
-            body.append(self.parse_statement())
-        self.eat('RBRACE')
-        return While(cond, body)
+        start = self.eat('LBRACE')
+        body = yield self._parse_stmt_list()
+        self.close_block()
+        return self._new(While(cond, body, self._span(start)))
 
-    def parse_call_with_name(self, name: str)->Call:
+    def _parse_call_with_name(self, name_tok: Token):
         self.eat('LPAREN')
         args = []
         if self.current().tipo != 'RPAREN':
-            args.append(self.parse_expr())
+            args.append((yield self._parse_expr()))
             while self.current().tipo == 'COMMA':
                 self.eat('COMMA')
-                args.append(self.parse_expr())
+                args.append((yield self._parse_expr()))
         self.eat('RPAREN')
-        return Call(name, args)
-
-    def parse_expr(self)->Expr:
-        return self.parse_rel()
-
-    def parse_rel(self)->Expr:
-        node = self.parse_add()
-        while self.current().tipo == 'OP' and self.current().lexema in ('==','!=','<','>','<=','>='):
-            op = self.eat('OP').lexema
-            right = self.parse_add()
-            node = BinaryOp(node, op, right)
-        return node
-
-    def parse_add(self)->Expr:
-        node = self.parse_mul()
-        while self.current().tipo == 'OP' and self.current().lexema in ('+','-'):
-            op = self.eat('OP').lexema
-            right = self.parse_mul()
-            node = BinaryOp(node, op, right)
-        return node
-
-    def parse_mul(self)->Expr:
-        node = self.parse_unary()
-        while self.current().tipo == 'OP' and self.current().lexema in ('*','/'):
-            op = self.eat('OP').lexema
-            right = self.parse_unary()
-            node = BinaryOp(node, op, right)
-        return node
-
-    def parse_unary(self)->Expr:
+        return self._new(Call(name_tok.texto, args), name_tok)
+
+    def _parse_expr(self, min_prec: int=1):
+        left = yield self._parse_unary()
+        t = self.tokens[self.pos]
+        if t.tipo == 'OP' and BINARY_PRECEDENCE.get(t.lexema, 0) >= min_prec:
+            left = yield self._parse_binary(left, min_prec)
+        return left
+
+    def _parse_binary(self, left: Expr, min_prec: int):
+        # Precedence climbing sobre BINARY_PRECEDENCE: solo se baja un nivel
+        # cuando el operador siguiente liga mas fuerte (o igual si esta en
+        # RIGHT_ASSOC); los operadores de igual precedencia se encadenan a
+        # izquierda en el mismo bucle.
+        tokens = self.tokens
+        precedence = BINARY_PRECEDENCE
+        t = tokens[self.pos]
+        prec = precedence.get(t.lexema) if t.tipo == 'OP' else None
+        while prec is not None and prec >= min_prec:
+            op = t.lexema
+            self.pos += 1
+            right = yield self._parse_unary()
+            t = tokens[self.pos]
+            nxt = precedence.get(t.lexema) if t.tipo == 'OP' else None
+            while nxt is not None and (nxt > prec or (nxt == prec and t.lexema in RIGHT_ASSOC)):
+                right = yield self._parse_binary(right, prec + 1 if nxt > prec else prec)
+                t = tokens[self.pos]
+                nxt = precedence.get(t.lexema) if t.tipo == 'OP' else None
+            left = self._new(BinaryOp(left, op, right))
+            prec = nxt
+        return left
+
+    def _parse_unary(self):
         t = self.current()
-        if t.tipo == 'OP' and t.lexema in ('+','-'):
-            op = self.eat('OP').lexema
-            right = self.parse_unary()
-            return BinaryOp(Number(0), op, right)
-        return self.parse_postfix()
+        if t.tipo == 'OP' and t.lexema in UNARY_OPS:
+            return self._parse_unary_op()
+        return self._parse_postfix()
 
-    def parse_postfix(self)->Expr:
+    def _parse_unary_op(self):
+        op = self.eat('OP').lexema
+        right = yield self._parse_unary()
+        return self._new(BinaryOp(self._new(Number(0)), op, right))
+
+    def _parse_postfix(self):
         t = self.current()
         if t.tipo == 'NUMBER':
-            v = float(self.eat('NUMBER').lexema)
-            return Number(v)
+            v = float(self.eat('NUMBER').texto)
+            return self._new(Number(v))
         if t.tipo == 'ID':
-            name = self.eat('ID').lexema
+            name_tok = self.eat('ID')
+            name = name_tok.texto
             if self.current().tipo == 'LPAREN':
-                return self.parse_call_with_name(name)
+                return self._parse_call_with_name(name_tok)
             if self.current().tipo == 'LBRACK':
-                self.eat('LBRACK')
-                idx = self.parse_expr()
-                self.eat('RBRACK')
-                return ArrayAccess(name, idx)
+                return self._parse_index(name_tok)
             if self.current().tipo == 'DOT':
                 self.eat('DOT')
-                fld = self.eat('ID').lexema
-                return FieldAccess(Var(name), fld)
-            return Var(name)
+                fld = self.eat('ID').texto
+                return self._new(FieldAccess(self._new(Var(name), name_tok), fld))
+            return self._new(Var(name), name_tok)
         if t.tipo == 'LPAREN':
-            self.eat('LPAREN')
-            e = self.parse_expr()
-            self.eat('RPAREN')
-            return e
-        raise ParserError(f"Factor inesperado: {t}")
-    # PARTE 3: Generador TAC y Visualizador AST
+            return self._parse_paren()
+        raise ParserError(f"Factor inesperado: {t}", t.linea, t.columna)
+
+    def _parse_index(self, name_tok: Token):
+        self.eat('LBRACK')
+        idx = yield self._parse_expr()
+        self.eat('RBRACK')
+        return self._new(ArrayAccess(name_tok.texto, idx), name_tok)
 
-class TACGenerator:
+    def _parse_paren(self):
+        self.eat('LPAREN')
+        e = yield self._parse_expr()
+        self.eat('RPAREN')
+        return e
+def _top_level_ends(tokens, pos: int=0)->List[int]:
+    # Indices donde termina cada declaracion o sentencia de nivel superior:
+    # despues de ';' o '}' fuera de llaves, salvo que siga un ELSE.
+    ends: List[int] = []
+    depth = 0
+    i = pos
+    tipo = tokens[i].tipo
+    while tipo != 'EOF':
+        if tipo == 'LBRACE':
+            depth += 1
+        elif tipo == 'RBRACE' or (tipo == 'SEMICOLON' and depth == 0):
+            if tipo == 'RBRACE':
+                depth = max(depth - 1, 0)
+            if depth == 0 and tokens[i+1].tipo != 'ELSE':
+                ends.append(i + 1)
+        i += 1
+        tipo = tokens[i].tipo
+    if i > pos and (not ends or ends[-1] != i):
+        ends.append(i)
+    return ends
+
+def _parse_chunk(job: Tuple[List[Tuple], bool])->Tuple[Optional['FlatAST'], int]:
+    # Los ids empiezan en 0; el Program se crea al final y su id es el
+    # numero de nodos del trozo. Se devuelve como FlatAST: las columnas
+    # viajan como bytes y el proceso principal arma los nodos con
+    # to_tree(primer id del trozo), sin recorrer el arbol otra vez.
+    rows, positions = job
+    try:
+        program = Parser([Token(*r) for r in rows], positions=positions).parse()
+    except ParserError:
+        return None, 0
+    return FlatAST.from_tree(program), program.id
+
+# Subir al cambiar el AST o el parser: invalida las entradas de ASTCache
+COMPILER_VERSION = '4'
+
+def _node_classes()->Dict[str, type]:
+    classes = {}
+    pending = [ASTNode]
+    while pending:
+        cls = pending.pop()
+        if cls.__dict__.get('_flat_view'):
+            continue
+        classes[cls.__name__] = cls
+        pending.extend(cls.__subclasses__())
+    return classes
+
+class ASTCache:
+    # Cache en disco de Program indexada por sha256(COMPILER_VERSION, fuente).
+    # Cada entrada es la lista en postorden de (clase, id, atributos simples,
+    # forma de los hijos, numero de hijos) serializada con marshal y zlib; al
+    # cargar se reconstruye con una pila sin pasar por el lexer ni el parser. Las entradas menos
+    # usadas (mtime mas viejo) se borran cuando el directorio pasa de
+    # max_bytes.
+    def __init__(self, directory: str='.ast_cache', max_bytes: int=64 << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, src: str)->str:
+        h = hashlib.sha256(f"{COMPILER_VERSION}\0{src}".encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, h + '.ast')
+
+    def load(self, src: str, pool: Optional[StringPool]=None)->Optional[Program]:
+        path = self._path(src)
+        # Cargar crea muchos objetos de golpe; sin pausar el GC la mitad del
+        # tiempo se va en colecciones que no liberan nada.
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(path, 'rb') as f:
+                records = marshal.loads(zlib.decompress(f.read()))
+            program = self.decode(records, pool)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (EOFError, ValueError, TypeError, KeyError, IndexError, zlib.error):
+            # entrada corrupta o de otro formato
+            os.remove(path)
+            self.misses += 1
+            return None
+        finally:
+            if enabled:
+                gc.enable()
+        os.utime(path)
+        self.hits += 1
+        return program
+
+    def store(self, src: str, program: Program):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(src)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(zlib.compress(marshal.dumps(self.encode(program))))
+        os.replace(tmp, path)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith('.ast'):
+                continue
+            st = os.stat(os.path.join(self.directory, name))
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    @staticmethod
+    def encode(program: Program)->List[Tuple]:
+        records = []
+        stack: List[Tuple[ASTNode, bool]] = [(program, False)]
+        while stack:
+            node, done = stack.pop()
+            if not done:
+                stack.append((node, True))
+                stack.extend((c, False) for c in reversed(list(iter_child_nodes(node))))
+                continue
+            shapes = []
+            count = 0
+            for name in node._fields:
+                value = getattr(node, name, ASTCache)
+                if value is ASTCache:
+                    continue
+                if value is None:
+                    shapes.append((name, None))
+                elif isinstance(value, list):
+                    shapes.append((name, len(value)))
+                    count += len(value)
+                else:
+                    shapes.append((name, -1))
+                    count += 1
+            attrs = {k: getattr(node, k) for k in node._attrs}
+            for k in POSITION_SLOTS:
+                if k in node.__slots__:
+                    attrs[k] = _stored_position(node, k)
+            records.append((node.__class__.__name__, node.id, attrs, tuple(shapes), count))
+        return records
+
+    @staticmethod
+    def decode(records: List[Tuple], pool: Optional[StringPool]=None)->Program:
+        # Los name_id dependen del StringPool de cada ejecucion, asi que se
+        # vuelven a internar en vez de guardarse.
+        classes = _node_classes()
+        stack: List[ASTNode] = []
+        top = 0
+        for cls_name, ident, attrs, shapes, count in records:
+            cls = classes[cls_name]
+            node = cls.__new__(cls)
+            for k, v in attrs.items():
+                setattr(node, k, v)
+            node.id = ident
+            if ident >= top:
+                top = ident + 1
+            if count:
+                children = stack[-count:]
+                del stack[-count:]
+            else:
+                children = []
+            k = 0
+            for name, n in shapes:
+                if n is None:
+                    setattr(node, name, None)
+                elif n == -1:
+                    setattr(node, name, children[k])
+                    k += 1
+                else:
+                    setattr(node, name, children[k:k+n])
+                    k += n
+            if 'name_id' in cls.__slots__:
+                node.name_id = pool.intern(node.name) if pool is not None else None
+            stack.append(node)
+        program = stack.pop()
+        program.ids = IdAllocator(top)
+        return program
+
+# Clases de nodo de FlatAST; LIST agrupa los hijos de un campo lista y NONE
+# ocupa el lugar de un campo opcional vacio.
+NODE_KINDS = [
+    'Program','ConstDecl','VarDecl','ArrayDecl','TypeDecl','FunctionDecl','ProcedureDecl',
+    'Assign','If','While','Return','ExprStmt',
+    'BinaryOp','Number','Var','Call','ArrayAccess','FieldAccess',
+    'LIST','NONE'
+]
+NODE_CODES = {k: i for i, k in enumerate(NODE_KINDS)}
+FLAT_LIST = NODE_CODES['LIST']
+FLAT_NONE = NODE_CODES['NONE']
+FLAT_OPS = list(BINARY_PRECEDENCE)
+FLAT_OP_CODES = {op: i for i, op in enumerate(FLAT_OPS)}
+
+def _payload_names(cls: type)->Tuple[str, ...]:
+    # Atributos simples que van a payloads; el operador va en su columna
+    names = tuple(a for a in cls._attrs if a != 'op')
+    slots = cls.__dict__.get('__slots__', ())
+    names += tuple(k for k in ('name_id',) + POSITION_SLOTS if k in slots)
+    return names
+
+class FlatAST:
+    # AST en columnas array('i') en preorden: clase, operador, indice en
+    # payloads, primer hijo y siguiente hermano (-1 si no hay). Los hijos de
+    # cada nodo siguen el orden de _fields de su clase. view() da objetos que
+    # son subclases de las clases del AST y leen de las columnas, asi que
+    # TACGenerator y ASTVisualizer funcionan igual sobre las dos formas.
     def __init__(self):
-        self.temp_count = 0
+        self.kinds = array('i')
+        self.ops = array('i')
+        self.payload = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.ids = array('i')
+        self.payloads: List[Tuple] = []
+        self.next_id = 0
+
+    @classmethod
+    def from_tree(cls, root: ASTNode)->'FlatAST':
+        flat = cls()
+        kinds, ops, payload = flat.kinds, flat.ops, flat.payload
+        first_child, next_sibling, ids = flat.first_child, flat.next_sibling, flat.ids
+        payloads = flat.payloads
+        codes = NODE_CODES
+        last: List[int] = []
+        top = 0
+        stack: List[Tuple[Any, int]] = [(root, -1)]
+        while stack:
+            item, parent = stack.pop()
+            i = len(kinds)
+            first_child.append(-1)
+            next_sibling.append(-1)
+            last.append(-1)
+            if parent >= 0:
+                prev = last[parent]
+                if prev < 0:
+                    first_child[parent] = i
+                else:
+                    next_sibling[prev] = i
+                last[parent] = i
+            if item is None:
+                kinds.append(FLAT_NONE); ops.append(-1); payload.append(-1); ids.append(-1)
+                continue
+            if item.__class__ is list:
+                kinds.append(FLAT_LIST); ops.append(-1); payload.append(-1); ids.append(-1)
+                stack.extend((c, i) for c in reversed(item))
+                continue
+            node_cls = item.__class__
+            kinds.append(codes[node_cls.__name__])
+            ops.append(FLAT_OP_CODES[item.op] if node_cls is BinaryOp else -1)
+            names = _payload_names(node_cls)
+            if names:
+                payload.append(len(payloads))
+                payloads.append(tuple(_stored_position(item, a) if a in POSITION_SLOTS else getattr(item, a)
+                                      for a in names))
+            else:
+                payload.append(-1)
+            ids.append(item.id)
+            if item.id >= top:
+                top = item.id + 1
+            children = []
+            for name in node_cls._fields:
+                value = getattr(item, name, FlatAST)
+                if value is not FlatAST:
+                    children.append(value)
+            stack.extend((c, i) for c in reversed(children))
+        ids_alloc = getattr(root, 'ids', None)
+        flat.next_id = ids_alloc.next if ids_alloc is not None else top
+        return flat
+
+    def __len__(self)->int:
+        return len(self.kinds)
+
+    def children(self, i: int)->Iterator[int]:
+        c = self.first_child[i]
+        nxt = self.next_sibling
+        while c >= 0:
+            yield c
+            c = nxt[c]
+
+    def preorder(self)->Iterator[int]:
+        # Los nodos ya estan en preorden; solo se saltan LIST y NONE
+        kinds = self.kinds
+        for i in range(len(kinds)):
+            if kinds[i] < FLAT_LIST:
+                yield i
+
+    def postorder(self)->Iterator[int]:
+        # Pila de (nodo, siguiente hijo por visitar)
+        kinds, first_child, next_sibling = self.kinds, self.first_child, self.next_sibling
+        stack = [(0, first_child[0])]
+        while stack:
+            i, c = stack[-1]
+            if c >= 0:
+                stack[-1] = (i, next_sibling[c])
+                stack.append((c, first_child[c]))
+                continue
+            stack.pop()
+            if kinds[i] < FLAT_LIST:
+                yield i
+
+    def to_tree(self, id_offset: int=0)->ASTNode:
+        # Se construye de atras hacia adelante: en preorden los hijos tienen
+        # indices mayores que el padre. id_offset se suma a todos los ids.
+        classes = _node_classes()
+        info = {}
+        for k, name in enumerate(NODE_KINDS[:FLAT_LIST]):
+            cls = classes[name]
+            info[k] = (cls, _payload_names(cls), cls._fields)
+        kinds, ops, payload, ids = self.kinds, self.ops, self.payload, self.ids
+        first_child, next_sibling, payloads = self.first_child, self.next_sibling, self.payloads
+        flat_ops = FLAT_OPS
+        built: List[Any] = [None] * len(kinds)
+        for i in range(len(kinds) - 1, -1, -1):
+            k = kinds[i]
+            if k == FLAT_NONE:
+                continue
+            c = first_child[i]
+            if k == FLAT_LIST:
+                items = []
+                while c >= 0:
+                    items.append(built[c])
+                    c = next_sibling[c]
+                built[i] = items
+                continue
+            cls, names, fields = info[k]
+            node = cls.__new__(cls)
+            node.id = ids[i] + id_offset
+            p = payload[i]
+            if p >= 0:
+                for name, value in zip(names, payloads[p]):
+                    setattr(node, name, value)
+            if ops[i] >= 0:
+                node.op = flat_ops[ops[i]]
+            for name in fields:
+                if c < 0:
+                    break
+                setattr(node, name, built[c])
+                c = next_sibling[c]
+            built[i] = node
+        root = built[0]
+        if isinstance(root, Program):
+            root.ids = IdAllocator(self.next_id + id_offset)
+        return root
+
+    def view(self, i: int=0)->ASTNode:
+        k = self.kinds[i]
+        if k == FLAT_NONE:
+            return None
+        if k == FLAT_LIST:
+            return [self.view(c) for c in self.children(i)]
+        view_cls = _FLAT_VIEWS.get(k)
+        if view_cls is None:
+            view_cls = _FLAT_VIEWS[k] = _flat_view_class(_node_classes()[NODE_KINDS[k]])
+        v = view_cls.__new__(view_cls)
+        v._flat = self
+        v._i = i
+        return v
+
+    def nbytes(self)->int:
+        cols = (self.kinds, self.ops, self.payload, self.first_child, self.next_sibling, self.ids)
+        return sum(a.itemsize * len(a) for a in cols)
+
+_FLAT_VIEWS: Dict[int, type] = {}
+
+def _flat_child(k: int, name: str)->property:
+    def get(self):
+        flat = self._flat
+        c = flat.first_child[self._i]
+        for _ in range(k):
+            if c < 0:
+                break
+            c = flat.next_sibling[c]
+        if c < 0:
+            raise AttributeError(name)
+        return flat.view(c)
+    return property(get)
+
+def _flat_payload(k: int)->property:
+    return property(lambda self: self._flat.payloads[self._flat.payload[self._i]][k])
+
+def _flat_view_class(cls: type)->type:
+    # Subclase con el mismo nombre (ASTVisualizer despacha por nombre) cuyos
+    # atributos se leen de las columnas de FlatAST.
+    ns: Dict[str, Any] = {'__slots__': ('_flat', '_i'), '_flat_view': True}
+    ns['id'] = property(lambda self: self._flat.ids[self._i])
+    for k, name in enumerate(cls._fields):
+        ns[name] = _flat_child(k, name)
+    for k, name in enumerate(_payload_names(cls)):
+        ns[name] = _flat_payload(k)
+    if cls is BinaryOp:
+        ns['op'] = property(lambda self: FLAT_OPS[self._flat.ops[self._i]])
+    if cls is Program:
+        ns['ids'] = property(lambda self: IdAllocator(self._flat.next_id))
+    return type(cls.__name__, (cls,), ns)
+
+    # PARTE 3: Generador TAC y Visualizador AST
+
+class NodeVisitor:
+    # Base de las pasadas sobre el AST. El metodo para cada clase de nodo se
+    # busca una sola vez por (clase de visitante, clase de nodo): el primer
+    # `<visit_prefix><Clase>` siguiendo la MRO del nodo, o generic_visit. El
+    # resultado queda en la tabla _dispatch de la clase de visitante.
+    visit_prefix = '_visit_'
+    _dispatch: Dict[type, Any] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
+    def dispatch(self, node: ASTNode):
+        fn = self._dispatch.get(node.__class__)
+        if fn is None:
+            fn = self._resolve(node.__class__)
+        return fn(self, node)
+
+    @classmethod
+    def _resolve(cls, node_cls: type):
+        for klass in node_cls.__mro__:
+            fn = getattr(cls, cls.visit_prefix + klass.__name__, None)
+            if fn is not None:
+                break
+        else:
+            fn = cls.generic_visit
+        cls._dispatch[node_cls] = fn
+        return fn
+
+    def generic_visit(self, node: ASTNode):
+        raise Exception(f"Nodo no soportado: {node.__class__.__name__}")
+
+
+class TempAllocator:
+    # Nombres tN para los temporales, fuera de la tabla de simbolos. Cada
+    # temporal que produce TACGenerator se lee una sola vez, en la
+    # instruccion del nodo padre; despues de emitirla se libera y take()
+    # reutiliza el menor numero libre. count es cuantos nombres distintos hubo.
+    def __init__(self, prefix: str='t'):
+        self.prefix = prefix
+        self.live: Dict[str, int] = {}
+        self.free: List[int] = []
+        self.count = 0
+
+    def take(self)->str:
+        if self.free:
+            n = heappop(self.free)
+        else:
+            n = self.count
+            self.count += 1
+        t = f"{self.prefix}{n}"
+        self.live[t] = n
+        return t
+
+    def release(self, *names: str):
+        # Los nombres que no son temporales vivos (variables) se ignoran
+        for t in names:
+            n = self.live.pop(t, None)
+            if n is not None:
+                heappush(self.free, n)
+
+class TACGenerator(NodeVisitor):
+    def __init__(self, pool: Optional[StringPool]=None, align: int=8):
+        self.temps = TempAllocator()
         self.label_count = 0
         self.code: List[str] = []
-        self.symtab = SymbolTable()
+        self.symtab = SymbolTable(pool, align)
 
     def new_temp(self)->str:
-        t = f"t{self.temp_count}"
-        self.temp_count += 1
-        entry = SymbolEntry(name=t, sym_type='temp', data_type=None, size=8)
-        self.symtab.add(entry)
-        return t
+        return self.temps.take()
 
     def new_label(self)->str:
         l = f"L{self.label_count}"
         self.label_count += 1
-        entry = SymbolEntry(name=l, sym_type='label', label=l)
-        self.symtab.add(entry)
+        self.symtab.declare(l, 'label', label=l)
         return l
 
+    def _find(self, node)->int:
+        # Fila del nombre de node (-1 si no esta); no arma SymbolEntry
+        if node.name_id is not None and self.symtab.pool is not None:
+            return self.symtab.find_id(node.name_id)
+        return self.symtab.find(node.name)
+
+    def _use(self, node, kind: str, sym_type: str, **fields):
+        # Resuelve el nombre de node, lo declara en el scope actual si no
+        # existe (con sitio de declaracion en node) y anota el uso
+        row = self._find(node)
+        if row < 0:
+            row = self.symtab.declare(node.name, sym_type, pos=node.pos, **fields)
+        self.symtab.refer(row, kind, node.pos)
+
     def gen(self, line: str):
         self.code.append(line)
 
@@ -994,27 +3169,28 @@ class TACGenerator:
         for d in node.decls:
             if isinstance(d, ConstDecl):
                 ent = SymbolEntry(name=d.name, sym_type='const', data_type='float', size=8)
-                self.symtab.add(ent)
+                self.symtab.add(ent, d.pos)
             elif isinstance(d, ArrayDecl):
                 ent = SymbolEntry(name=d.name, sym_type='array', data_type='float', size=8*d.size)
-                self.symtab.add(ent)
+                self.symtab.add(ent, d.pos)
             elif isinstance(d, TypeDecl):
                 ent = SymbolEntry(name=d.name, sym_type='type', data_type=d.name, extra={'fields':d.fields})
-                self.symtab.add(ent)
+                self.symtab.add(ent, d.pos)
             elif isinstance(d, FunctionDecl):
                 ent = SymbolEntry(name=d.name, sym_type='func', params=[p[0] for p in d.params], return_type=d.ret_type, label=f"func_{d.name}")
-                self.symtab.add(ent)
+                self.symtab.add(ent, d.pos)
             elif isinstance(d, ProcedureDecl):
                 ent = SymbolEntry(name=d.name, sym_type='proc', params=[p[0] for p in d.params], label=f"proc_{d.name}")
-                self.symtab.add(ent)
+                self.symtab.add(ent, d.pos)
             elif isinstance(d, VarDecl):
                 ent = SymbolEntry(name=d.name, sym_type='var', data_type=d.typ or 'float', size=8)
-                self.symtab.add(ent)
+                self.symtab.add(ent, d.pos)
 
         for d in node.decls:
             if isinstance(d, ConstDecl):
                 t = self.visit_expr(d.value)
                 self.gen(f"{d.name} = {t}")
+                self.temps.release(t)
             elif isinstance(d, ArrayDecl):
                 pass
             elif isinstance(d, TypeDecl):
@@ -1024,216 +3200,265 @@ class TACGenerator:
                 self.gen(f"label {label}")
                 e = self.symtab.lookup(d.name)
                 if e: e.label = label
-                self.symtab.enter_scope()
-                for pname, _ in d.params:
+                self.symtab.enter_scope(d.span, f"function {d.name}", frame=True)
+                for i, (pname, _) in enumerate(d.params):
                     pentry = SymbolEntry(name=pname, sym_type='param', data_type=None, size=8)
-                    self.symtab.add(pentry)
+                    self.symtab.add(pentry, d.param_pos[i] if d.param_pos else None)
                 for s in d.body:
                     self.visit_stmt(s)
-                self.symtab.exit_scope()
+                frame = self.symtab.exit_scope()
+                if e: e.size = frame.frame_size
             elif isinstance(d, ProcedureDecl):
                 label = f"proc_{d.name}"
                 self.gen(f"label {label}")
                 e = self.symtab.lookup(d.name)
                 if e: e.label = label
-                self.symtab.enter_scope()
-                for pname,_ in d.params:
+                self.symtab.enter_scope(d.span, f"procedure {d.name}", frame=True)
+                for i, (pname, _) in enumerate(d.params):
                     pentry = SymbolEntry(name=pname, sym_type='param', data_type=None, size=8)
-                    self.symtab.add(pentry)
+                    self.symtab.add(pentry, d.param_pos[i] if d.param_pos else None)
                 for s in d.body:
                     self.visit_stmt(s)
-                self.symtab.exit_scope()
+                frame = self.symtab.exit_scope()
+                if e: e.size = frame.frame_size
             else:
                 if isinstance(d, Stmt):
                     self.visit_stmt(d)
         return self.code
 
     def visit_stmt(self, s: Stmt):
-        if isinstance(s, Assign):
-            rhs = self.visit_expr(s.expr)
-            if isinstance(s.target, Var):
-                name = s.target.name
-                if not self.symtab.lookup(name):
-                    self.symtab.add(SymbolEntry(name=name, sym_type='var', data_type='float', size=8))
-                self.gen(f"{name} = {rhs}")
-            elif isinstance(s.target, ArrayAccess):
-                arr = s.target.name
-                idx = self.visit_expr(s.target.index)
-                if not self.symtab.lookup(arr):
-                    self.symtab.add(SymbolEntry(name=arr, sym_type='array', data_type='float', size=None))
-                self.gen(f"store {arr}, {idx}, {rhs}")
-            elif isinstance(s.target, FieldAccess):
-                base_temp = self.visit_expr(s.target.expr)
-                field = s.target.field
-                self.gen(f"field_store {base_temp}, {field}, {rhs}")
-            else:
-                raise Exception("Assign target no soportado")
-        elif isinstance(s, ExprStmt):
-            self.visit_expr(s.expr)
-        elif isinstance(s, If):
-            condt = self.visit_expr(s.cond)
-            l_else = self.new_label()
-            l_end = self.new_label()
-            self.gen(f"if_false {condt} goto {l_else}")
-            self.symtab.enter_scope()
-            for st in s.then_block:
-                self.visit_stmt(st)
-            self.symtab.exit_scope()
-            self.gen(f"goto {l_end}")
-            self.gen(f"label {l_else}")
-            if s.else_block:
-                self.symtab.enter_scope()
-                for st in s.else_block:
-                    self.visit_stmt(st)
-                self.symtab.exit_scope()
-            self.gen(f"label {l_end}")
-        elif isinstance(s, While):
-            l_begin = self.new_label()
-            l_end = self.new_label()
-            self.gen(f"label {l_begin}")
-            condt = self.visit_expr(s.cond)
-            self.gen(f"if_false {condt} goto {l_end}")
-            self.symtab.enter_scope()
-            for st in s.body:
-                self.visit_stmt(st)
+        run_stack(self._visit_stmt(s))
+
+    def visit_expr(self, e: Expr)->str:
+        return run_stack(self._visit_expr(e))
+
+    # Los _visit_<Clase> devuelven tareas para run_stack (ver Parser): las
+    # hojas se resuelven al momento y el resto son generadores.
+
+    def _visit_stmt(self, s: Stmt):
+        return self.dispatch(s)
+
+    def _visit_expr(self, e: Expr):
+        return self.dispatch(e)
+
+    def generic_visit(self, node: ASTNode):
+        if isinstance(node, Expr):
+            raise Exception("Expr no soportada en visit_expr")
+        raise Exception("Stmt no soportado en visit_stmt")
+
+    def _visit_Assign(self, s: Assign):
+        rhs = yield self.dispatch(s.expr)
+        if isinstance(s.target, Var):
+            name = s.target.name
+            self._use(s.target, 'write', 'var', data_type='float', size=8)
+            self.gen(f"{name} = {rhs}")
+            self.temps.release(rhs)
+        elif isinstance(s.target, ArrayAccess):
+            arr = s.target.name
+            idx = yield self.dispatch(s.target.index)
+            self._use(s.target, 'write', 'array', data_type='float')
+            self.gen(f"store {arr}, {idx}, {rhs}")
+            self.temps.release(idx, rhs)
+        elif isinstance(s.target, FieldAccess):
+            base_temp = yield self.dispatch(s.target.expr)
+            field = s.target.field
+            self.gen(f"field_store {base_temp}, {field}, {rhs}")
+            self.temps.release(base_temp, rhs)
+        else:
+            raise Exception("Assign target no soportado")
+
+    def _visit_ExprStmt(self, s: ExprStmt):
+        # El valor no se usa: el temporal queda libre enseguida
+        self.temps.release((yield self.dispatch(s.expr)))
+
+    def _visit_If(self, s: If):
+        condt = yield self.dispatch(s.cond)
+        l_else = self.new_label()
+        l_end = self.new_label()
+        self.gen(f"if_false {condt} goto {l_else}")
+        self.temps.release(condt)
+        self.symtab.enter_scope(s.then_span, 'if')
+        for st in s.then_block:
+            yield self.dispatch(st)
+        self.symtab.exit_scope()
+        self.gen(f"goto {l_end}")
+        self.gen(f"label {l_else}")
+        if s.else_block:
+            self.symtab.enter_scope(s.else_span, 'else')
+            for st in s.else_block:
+                yield self.dispatch(st)
             self.symtab.exit_scope()
-            self.gen(f"goto {l_begin}")
-            self.gen(f"label {l_end}")
-        elif isinstance(s, Return):
-            if s.expr:
-                val = self.visit_expr(s.expr)
-                self.gen(f"return {val}")
-            else:
-                self.gen("return")
+        self.gen(f"label {l_end}")
+
+    def _visit_While(self, s: While):
+        l_begin = self.new_label()
+        l_end = self.new_label()
+        self.gen(f"label {l_begin}")
+        condt = yield self.dispatch(s.cond)
+        self.gen(f"if_false {condt} goto {l_end}")
+        self.temps.release(condt)
+        self.symtab.enter_scope(s.body_span, 'while')
+        for st in s.body:
+            yield self.dispatch(st)
+        self.symtab.exit_scope()
+        self.gen(f"goto {l_begin}")
+        self.gen(f"label {l_end}")
+
+    def _visit_Return(self, s: Return):
+        if s.expr:
+            val = yield self.dispatch(s.expr)
+            self.gen(f"return {val}")
+            self.temps.release(val)
         else:
-            raise Exception("Stmt no soportado en visit_stmt")
+            self.gen("return")
 
-    def visit_expr(self, e: Expr)->str:
-        if isinstance(e, Number):
-            t = self.new_temp()
-            self.gen(f"{t} = {e.value}")
-            return t
-        if isinstance(e, Var):
-            ent = self.symtab.lookup(e.name)
-            if not ent:
-                self.symtab.add(SymbolEntry(name=e.name, sym_type='var', data_type='float', size=8))
-            return e.name
-        if isinstance(e, Call):
-            arg_temps = []
-            for a in e.args:
-                arg_temps.append(self.visit_expr(a))
-            for at in arg_temps:
-                self.gen(f"param {at}")
-            t = self.new_temp()
-            self.gen(f"{t} = call {e.name}, {len(arg_temps)}")
-            if not self.symtab.lookup(e.name):
-                self.symtab.add(SymbolEntry(name=e.name, sym_type='func', params=[None]*len(e.args), label=f"func_{e.name}"))
-            return t
-        if isinstance(e, ArrayAccess):
-            idx = self.visit_expr(e.index)
-            t = self.new_temp()
-            self.gen(f"{t} = load {e.name}, {idx}")
-            if not self.symtab.lookup(e.name):
-                self.symtab.add(SymbolEntry(name=e.name, sym_type='array', data_type='float'))
-            return t
-        if isinstance(e, FieldAccess):
-            base = self.visit_expr(e.expr)
-            t = self.new_temp()
-            self.gen(f"{t} = field_load {base}, {e.field}")
-            return t
-        if isinstance(e, BinaryOp):
-            l = self.visit_expr(e.left)
-            r = self.visit_expr(e.right)
-            t = self.new_temp()
-            self.gen(f"{t} = {l} {e.op} {r}")
-            return t
-        raise Exception("Expr no soportada en visit_expr")
-
-
-class ASTVisualizer:
-    def __init__(self):
+    def _visit_Number(self, e: Number)->str:
+        t = self.new_temp()
+        self.gen(f"{t} = {e.value}")
+        return t
+
+    def _visit_Var(self, e: Var)->str:
+        self._use(e, 'read', 'var', data_type='float', size=8)
+        return e.name
+
+    def _visit_Call(self, e: Call):
+        arg_temps = []
+        for a in e.args:
+            arg_temps.append((yield self.dispatch(a)))
+        for at in arg_temps:
+            self.gen(f"param {at}")
+        self.temps.release(*arg_temps)
+        t = self.new_temp()
+        self.gen(f"{t} = call {e.name}, {len(arg_temps)}")
+        self._use(e, 'call', 'func', params=[None]*len(e.args), label=f"func_{e.name}")
+        return t
+
+    def _visit_ArrayAccess(self, e: ArrayAccess):
+        idx = yield self.dispatch(e.index)
+        self.temps.release(idx)
+        t = self.new_temp()
+        self.gen(f"{t} = load {e.name}, {idx}")
+        self._use(e, 'read', 'array', data_type='float')
+        return t
+
+    def _visit_FieldAccess(self, e: FieldAccess):
+        base = yield self.dispatch(e.expr)
+        self.temps.release(base)
+        t = self.new_temp()
+        self.gen(f"{t} = field_load {base}, {e.field}")
+        return t
+
+    def _visit_BinaryOp(self, e: BinaryOp):
+        l = yield self.dispatch(e.left)
+        r = yield self.dispatch(e.right)
+        self.temps.release(l, r)
+        t = self.new_temp()
+        self.gen(f"{t} = {l} {e.op} {r}")
+        return t
+
+
+class ASTVisualizer(NodeVisitor):
+    # Igual que TACGenerator: cada _visit_X es una tarea para run_stack y
+    # los hijos se visitan con `yield self.dispatch(hijo)`. Los nodos
+    # auxiliares (Then, Else, Body, campos) toman ids de una copia del
+    # IdAllocator del Program, o de uno que empieza despues del mayor id del
+    # arbol; asi dibujar no gasta ids del AST y dos render dan el mismo DOT.
+    # Los nodos sin id (armados a mano o con ExprFactory fuera del Parser)
+    # reciben uno de ese mismo allocator solo para el dibujo.
+    def __init__(self, ids: Optional[IdAllocator]=None):
         self.lines = ["digraph AST {", "node [shape=box];"]
+        self.ids = ids
+        self.fresh: Dict[int, int] = {}
     def render(self, node: ASTNode)->str:
-        self._visit(node)
+        if self.ids is None:
+            ids = getattr(node, 'ids', None)
+            self.ids = IdAllocator(ids.next if ids is not None else max(n.id for n in walk(node)) + 1)
+        run_stack(self.dispatch(node))
         self.lines.append("}")
         return "\n".join(self.lines)
+    def _name(self,node)->int:
+        i = node.id
+        if i < 0:
+            i = self.fresh.get(id(node))
+            if i is None:
+                i = self.fresh[id(node)] = self.ids.take()
+        return i
     def _label(self,node,text):
-        self.lines.append(f' n{node.id} [label="{text}"];')
+        self.lines.append(f' n{self._name(node)} [label="{text}"];')
     def _edge(self,a,b):
-        self.lines.append(f' n{a.id} -> n{b.id};')
-    def _visit(self,node):
-        method = '_visit_' + node.__class__.__name__
-        if hasattr(self, method):
-            getattr(self, method)(node)
-        else:
-            self._label(node, node.__class__.__name__)
+        self.lines.append(f' n{self._name(a)} -> n{self._name(b)};')
+    def _aux(self,text):
+        node = ASTNode(); node.id = self.ids.take()
+        self._label(node,text)
+        return node
+    def generic_visit(self,node):
+        self._label(node, node.__class__.__name__)
 
     def _visit_Program(self,node: Program):
         self._label(node,'Program')
         for d in node.decls:
-            self._visit(d); self._edge(node,d)
+            yield self.dispatch(d); self._edge(node,d)
     def _visit_ConstDecl(self,n):
         self._label(n,f"Const {n.name}")
-        self._visit(n.value); self._edge(n,n.value)
+        yield self.dispatch(n.value); self._edge(n,n.value)
     def _visit_ArrayDecl(self,n):
         self._label(n,f"Array {n.name}[{n.size}]")
     def _visit_TypeDecl(self,n):
         self._label(n,f"Type {n.name}")
         for f in n.fields:
-            fn = ASTNode(); self._label(fn,f[0]); self._edge(n,fn)
+            fn = self._aux(f[0]); self._edge(n,fn)
     def _visit_FunctionDecl(self,n):
         self._label(n,f"Function {n.name}({','.join([p[0] for p in n.params])})")
         for s in n.body:
-            self._visit(s); self._edge(n,s)
+            yield self.dispatch(s); self._edge(n,s)
     def _visit_ProcedureDecl(self,n):
         self._label(n,f"Procedure {n.name}({','.join([p[0] for p in n.params])})")
         for s in n.body:
-            self._visit(s); self._edge(n,s)
+            yield self.dispatch(s); self._edge(n,s)
     def _visit_Assign(self,n):
         self._label(n,"Assign")
-        self._visit(n.target); self._edge(n,n.target)
-        self._visit(n.expr); self._edge(n,n.expr)
+        yield self.dispatch(n.target); self._edge(n,n.target)
+        yield self.dispatch(n.expr); self._edge(n,n.expr)
     def _visit_Var(self,n):
         self._label(n,f"Var\\n{n.name}")
     def _visit_Number(self,n):
         self._label(n,f"Number\\n{n.value}")
     def _visit_BinaryOp(self,n):
         self._label(n,f"BinOp\\n{n.op}")
-        self._visit(n.left); self._edge(n,n.left)
-        self._visit(n.right); self._edge(n,n.right)
+        yield self.dispatch(n.left); self._edge(n,n.left)
+        yield self.dispatch(n.right); self._edge(n,n.right)
     def _visit_Call(self,n):
         self._label(n,f"Call\\n{n.name}()")
         for a in n.args:
-            self._visit(a); self._edge(n,a)
+            yield self.dispatch(a); self._edge(n,a)
     def _visit_ArrayAccess(self,n):
         self._label(n,f"ArrayAccess\\n{n.name}")
-        self._visit(n.index); self._edge(n,n.index)
+        yield self.dispatch(n.index); self._edge(n,n.index)
     def _visit_FieldAccess(self,n):
         self._label(n,f"FieldAccess\\n{n.field}")
-        self._visit(n.expr); self._edge(n,n.expr)
+        yield self.dispatch(n.expr); self._edge(n,n.expr)
     def _visit_If(self,n):
         self._label(n,"If")
-        self._visit(n.cond); self._edge(n,n.cond)
-        then_node = ASTNode(); self._label(then_node,"Then"); self._edge(n,then_node)
+        yield self.dispatch(n.cond); self._edge(n,n.cond)
+        then_node = self._aux("Then"); self._edge(n,then_node)
         for s in n.then_block:
-            self._visit(s); self._edge(then_node,s)
+            yield self.dispatch(s); self._edge(then_node,s)
         if n.else_block:
-            else_node = ASTNode(); self._label(else_node,"Else"); self._edge(n,else_node)
+            else_node = self._aux("Else"); self._edge(n,else_node)
             for s in n.else_block:
-                self._visit(s); self._edge(else_node,s)
+                yield self.dispatch(s); self._edge(else_node,s)
     def _visit_While(self,n):
-        self._label(n,"While"); self._visit(n.cond); self._edge(n,n.cond)
-        body = ASTNode(); self._label(body,"Body"); self._edge(n,body)
+        self._label(n,"While"); yield self.dispatch(n.cond); self._edge(n,n.cond)
+        body = self._aux("Body"); self._edge(n,body)
         for s in n.body:
-            self._visit(s); self._edge(body,s)
+            yield self.dispatch(s); self._edge(body,s)
     def _visit_Return(self,n):
         self._label(n,"Return")
         if n.expr:
-            self._visit(n.expr); self._edge(n,n.expr)
+            yield self.dispatch(n.expr); self._edge(n,n.expr)
     def _visit_ExprStmt(self,n):
         self._label(n,"ExprStmt")
-        self._visit(n.expr); self._edge(n,n.expr)
-
+        yield self.dispatch(n.expr); self._edge(n,n.expr)
 
 def try_make_png(dotfile="ast.dot", pngfile="ast.png"):
     if shutil.which("dot"):
@@ -1259,19 +3484,26 @@ if __name__ == '__main__':
     print("\n--- CODIGO FUENTE ---")
     print(src)
 
-    lexer = Lexer(src)
-    tokens = lexer.tokenize()
-    print(f"\n--- TOKENS ({len(tokens)} generados) ---")
-    for t in tokens:
-        print(t)
-
-    parser = Parser(tokens)
-    try:
+    pool = StringPool()
+    cache = ASTCache()
+    program = cache.load(src, pool)
+    if program is None:
+        lexer = RegexLexer(src, pool=pool)
+        tokens = lexer.tokenize()
+        print(f"\n--- TOKENS ({len(tokens)} generados) ---")
+        for t in tokens:
+            print(t)
+
+        parser = Parser(tokens, recover=True)
         program = parser.parse()
+        if parser.errors:
+            for pe in parser.errors:
+                print(f"\nError de parseo: {pe}")
+            sys.exit(1)
         print("\nAnalisis sintactico completado")
-    except ParserError as pe:
-        print(f"\nError de parseo: {pe}")
-        sys.exit(1)
+        cache.store(src, program)
+    else:
+        print("\n--- AST cargado de cache (sin analisis lexico ni sintactico) ---")
 
     print("\n--- GENERANDO AST (archivo .dot) ---")
     vis = ASTVisualizer()
@@ -1283,13 +3515,15 @@ if __name__ == '__main__':
     try_make_png("ast.dot","ast.png")
 
     print("\n--- GENERANDO CODIGO INTERMEDIO (TAC) ---")
-    tacgen = TACGenerator()
+    tacgen = TACGenerator(pool)
     code = tacgen.generate(program)
     for i, line in enumerate(code, 1):
         print(f"{i:3d}: {line}")
 
     print("\n--- TABLA DE SIMBOLOS ---")
     print(tacgen.symtab)
+    tacgen.symtab.export_sqlite("simbolos.db")
+    print("Tabla exportada a simbolos.db")
 
     print("Desea visualizar el AST graficamente con tkinter? (s/n): ", end="")
     try:
@@ -1301,4 +3535,6 @@ if __name__ == '__main__':
         print("\nAbriendo visualizador grafico...")
         visualize_ast_from_dot("ast.dot")
     else:
-        print("\nCompilacion completada. Revisa ast.dot para el arbol.")
\ No newline at end of file
+        print("\nCompilacion completada. Revisa ast.dot para el arbol.")
+
+    print(f"\nCache AST: {cache.hits} aciertos, {cache.misses} fallos")
\ No newline at end of file
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+import tablasimbolos as T
+
+DATOS = os.path.join(os.path.dirname(T.__file__), 'datos.txt')
+
+
+def dump(node, pool):
+    # name_id depende del pool; se compara el nombre al que apunta
+    if isinstance(node, list):
+        return [dump(n, pool) for n in node]
+    if isinstance(node, T.ASTNode):
+        fields = {k: dump(getattr(node, k, None), pool) for k in node._attrs + node._fields}
+        for k in T.POSITION_SLOTS:
+            if k in node.__slots__:
+                fields[k] = getattr(node, k, None)
+        if 'name_id' in node.__slots__:
+            fields['name_id'] = pool.name(node.name_id)
+        return node.__class__.__name__, node.id, fields
+    return node
+
+
+def sources():
+    with open(DATOS, encoding='utf-8') as f:
+        datos = f.read()
+    return [
+        '',
+        'function f() {}',
+        'procedure p() { }',
+        'y = g();',
+        'while (a) { } if (b) { } else { }',
+        'function f(a) { return h(); } x = f(g());',
+        datos,
+    ]
+
+
+@pytest.mark.parametrize('src', sources())
+def test_store_load_round_trip(tmp_path, src):
+    pool = T.StringPool()
+    program = T.Parser(T.RegexLexer(src, pool=pool).tokenize()).parse()
+    cache = T.ASTCache(str(tmp_path))
+    cache.store(src, program)
+    fresh = T.StringPool()
+    loaded = cache.load(src, fresh)
+    assert cache.hits == 1 and cache.misses == 0
+    assert dump(loaded, fresh) == dump(program, pool)
+    assert T.ASTVisualizer().render(loaded) == T.ASTVisualizer().render(program)
+    assert T.TACGenerator().generate(loaded) == T.TACGenerator().generate(program)
+
+
+def test_round_trip_keeps_name_ids():
+    src = 'x = f(); y = x + f();'
+    pool = T.StringPool()
+    program = T.Parser(T.RegexLexer(src, pool=pool).tokenize()).parse()
+    assert dump(T.ASTCache.decode(T.ASTCache.encode(program), pool), pool) == dump(program, pool)
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = T.ASTCache(str(tmp_path))
+    cache.store('x = 1;', T.Parser(T.RegexLexer('x = 1;').tokenize()).parse())
+    path = cache._path('x = 1;')
+    with open(path, 'wb') as f:
+        f.write(b'basura')
+    assert cache.load('x = 1;') is None
+    assert cache.misses == 1 and not os.path.exists(path)
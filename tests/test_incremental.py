@@ -0,0 +1,67 @@
+import os
+import random
+
+import pytest
+
+import tablasimbolos as T
+
+DATOS = os.path.join(os.path.dirname(T.__file__), 'datos.txt')
+
+
+def rows(tokens):
+    return [(t.tipo, t.lexema, t.linea, t.columna) for t in tokens]
+
+
+def lexed(src):
+    try:
+        return rows(T.Lexer(src).tokenize())
+    except Exception as e:
+        return str(e)
+
+
+@pytest.mark.parametrize('group', [2, 64])
+def test_random_edits_match_full_lex(monkeypatch, group):
+    monkeypatch.setattr(T.TokenRope, 'GROUP', group)
+    with open(DATOS, encoding='utf-8') as f:
+        src = f.read()
+    pieces = ['', 'x', ' ', '\n', '\n' * 40, 'año = 2;\n', '}', '{ if (a) ', '12.5', 'b\nc', ';\n\n', '!']
+    rnd = random.Random(3)
+    for block_lines in (1, 4, 64):
+        inc = T.IncrementalLexer(src, block_lines)
+        text = src
+        for _ in range(300):
+            start = rnd.randint(0, len(text))
+            end = min(len(text), start + rnd.choice((0, 0, 1, 3, 20, 400)))
+            rep = rnd.choice(pieces)
+            new = text[:start] + rep + text[end:]
+            expected = lexed(new)
+            if isinstance(expected, str):
+                with pytest.raises(Exception) as err:
+                    inc.edit(start, end, rep)
+                assert str(err.value) == expected
+                assert inc.text == text
+                continue
+            tokens = inc.edit(start, end, rep)
+            text = new
+            assert inc.text == text
+            assert rows(tokens) == expected
+            assert rows(tokens[i] for i in range(len(tokens))) == expected
+            assert tokens[-1].tipo == 'EOF'
+
+
+def test_previous_snapshot_is_unchanged():
+    inc = T.IncrementalLexer('a = 1;\n' * 200, block_lines=8)
+    before = inc.tokens
+    expected = rows(before)
+    after = inc.edit(10, 10, 'b = 2;\n')
+    assert rows(before) == expected
+    assert rows(after) == rows(T.Lexer(inc.text).tokenize())
+    assert after[-1].linea == before[-1].linea + 1
+
+
+def test_delete_everything_and_parse():
+    inc = T.IncrementalLexer('x = 1;\ny = 2;\n', block_lines=1)
+    assert rows(inc.edit(0, len(inc.text), '')) == [('EOF', '', 1, 1)]
+    tokens = inc.edit(0, 0, 'z = 3;')
+    assert T.ASTVisualizer().render(T.Parser(tokens).parse()) == \
+        T.ASTVisualizer().render(T.Parser(T.Lexer('z = 3;').tokenize()).parse())
@@ -0,0 +1,110 @@
+import io
+import os
+import random
+
+import pytest
+
+import tablasimbolos as T
+
+DATOS = os.path.join(os.path.dirname(T.__file__), 'datos.txt')
+
+SAMPLES = [
+    '',
+    'x = 1;',
+    'if (a >= 10) { b = b * 2; } else { b = -1.5; }',
+    'function f(a, b) {\n\treturn a + b;\r\n}\n',
+    'año = 1; ñandú = año + 2;',
+    'x² = 3;',
+    '²³ x1 _y 12.5 3. ٣٤',
+    '一二 = 5;',
+]
+
+BAD = ['x = 1 ! 2;', 'y = 1 # 2;', 'z = ½;', 'w = 1;\n  $', 'x = ⅷ;']
+
+
+def rows(tokens):
+    return [(t.tipo, t.texto, t.linea, t.columna) for t in tokens]
+
+
+def run(f):
+    try:
+        return rows(f())
+    except Exception as e:
+        return str(e)
+
+
+def engines(src):
+    yield 'regex', lambda: T.RegexLexer(src).tokenize()
+    yield 'lazy', lambda: T.RegexLexer(src, lazy_positions=True).tokenize()
+    yield 'pool', lambda: T.RegexLexer(src, pool=T.StringPool()).tokenize()
+    yield 'bytes', lambda: T.RegexLexer(src.encode('utf-8')).tokenize()
+    yield 'bytes pool', lambda: T.RegexLexer(src.encode('utf-8'), pool=T.StringPool()).tokenize()
+    yield 'bytearray', lambda: T.RegexLexer(bytearray(src.encode('utf-8'))).tokenize()
+    yield 'iter', lambda: list(T.Lexer(src).iter_tokens())
+    yield 'stream', lambda: list(T.Lexer('').iter_tokens(io.StringIO(src), chunk_size=3))
+    yield 'tokens', lambda: list(T.TokenStream.from_text(src))
+    yield 'parallel', lambda: T.tokenize_parallel(src, workers=2, min_chunk=8)
+
+
+@pytest.mark.parametrize('src', SAMPLES + BAD)
+def test_engines_match_lexer(src):
+    expected = run(lambda: T.Lexer(src).tokenize())
+    for name, f in engines(src):
+        assert run(f) == expected, name
+
+
+def test_numbers_and_identifiers_follow_str_methods():
+    assert rows(T.RegexLexer('²').tokenize())[0][:2] == ('NUMBER', '²')
+    assert rows(T.RegexLexer('año').tokenize())[0][:2] == ('ID', 'año')
+    with pytest.raises(Exception, match="Caracter inesperado '½'"):
+        T.RegexLexer('½').tokenize()
+
+
+def test_numeric_classes_match_unicode():
+    # Las clases literales de TOKEN_RE siguen a isdigit/isalpha de este Python
+    assert T._numeric_classes() == (T._DIGIT_EXTRA, T._NUMERIC_NOT_ALPHA)
+
+
+def test_random_sources():
+    alpha = list("ab_Z09 .=!<>+-*/(){}[];:,\n\t\r#éñ²½") + ['if', 'while', '12.5', 'x1', 'return']
+    rnd = random.Random(1)
+    for _ in range(2000):
+        src = ''.join(rnd.choice(alpha) for _ in range(rnd.randint(0, 30)))
+        expected = run(lambda: T.Lexer(src).tokenize())
+        assert run(lambda: T.RegexLexer(src).tokenize()) == expected, src
+        assert run(lambda: list(T.TokenStream.from_text(src))) == expected, src
+        assert run(lambda: T.RegexLexer(src.encode('utf-8')).tokenize()) == expected, src
+
+
+@pytest.mark.parametrize('src', ['a = b + a; año = a;', b'a = b + a; a\xc3\xb1o = a;'])
+def test_pool_sets_ident(src):
+    pool = T.StringPool()
+    toks = T.RegexLexer(src, pool=pool).tokenize()
+    ids = [t.ident for t in toks if t.tipo == 'ID']
+    assert ids[0] == ids[2] == ids[4] != ids[1]
+    assert [pool.name(i) for i in ids] == ['a', 'b', 'a', 'año', 'a']
+    assert all(t.lexema is pool.name(t.ident) for t in toks if t.tipo == 'ID')
+
+
+def test_datos_bytes_source():
+    with open(DATOS, encoding='utf-8') as f:
+        src = f.read()
+    expected = rows(T.Lexer(src).tokenize())
+    with open(DATOS, 'rb') as f:
+        assert rows(T.RegexLexer(f.read()).tokenize()) == expected
+    assert rows(T.tokenize_parallel(src * 20, workers=2, min_chunk=256)) == rows(T.Lexer(src * 20).tokenize())
+
+
+def test_parallel_stream_feeds_parser():
+    with open(DATOS, encoding='utf-8') as f:
+        src = f.read() * 20
+    ts = T.tokenize_parallel(src, workers=2, min_chunk=256)
+    assert isinstance(ts, T.TokenStream) and ts.text is src
+    dot = T.ASTVisualizer().render(T.Parser(ts).parse())
+    assert dot == T.ASTVisualizer().render(T.Parser(T.Lexer(src).tokenize()).parse())
+
+
+def test_parallel_error_position():
+    src = 'x = 1;\n' * 200 + 'y = 2 # 3;\n' + 'z = 1;\n' * 200
+    with pytest.raises(Exception, match='en linea 201 columna 7'):
+        T.tokenize_parallel(src, workers=2, min_chunk=64)
@@ -0,0 +1,207 @@
+import os
+
+import pytest
+
+import tablasimbolos as T
+
+DATOS = os.path.join(os.path.dirname(T.__file__), 'datos.txt')
+
+
+def compile_(src, parallel, recover=False):
+    pool = T.StringPool()
+    parser = T.Parser(T.RegexLexer(src, pool=pool).tokenize(), recover=recover)
+    try:
+        program = parser.parse_parallel(workers=2, min_tokens=1) if parallel else parser.parse()
+    except T.ParserError as e:
+        return 'ERR ' + str(e)
+    if parser.errors:
+        return [str(e) for e in parser.errors]
+    return T.ASTVisualizer().render(program), T.TACGenerator(pool).generate(program), program.ids.next
+
+
+def sources():
+    with open(DATOS, encoding='utf-8') as f:
+        datos = f.read()
+    return [
+        datos,
+        datos * 5,
+        'if (a) x = 1; else y = 2; z = 3; if (a) { x = 1; } else { y = 2; } w = 1;',
+        'x = 1; y = ; z = 3; function f() { a = 1; } q = 2;',
+        'x = 1; function f() { a = 1; ',
+        'x = 1; } y = 2; type T { a; b; } array q[3]; const c = 4;',
+        'x = ' + '(' * 3000 + '1' + ')' * 3000 + '; y = 2;',
+        'if (a) { ' * 3000 + 'x = 1;' + ' }' * 3000 + ' y = 2;',
+    ]
+
+
+@pytest.mark.parametrize('recover', [False, True])
+@pytest.mark.parametrize('src', sources())
+def test_parse_parallel_matches_parse(src, recover):
+    assert compile_(src, True, recover) == compile_(src, False, recover)
+
+
+def test_flat_to_tree_offsets_ids():
+    with open(DATOS, encoding='utf-8') as f:
+        program = T.Parser(T.RegexLexer(f.read()).tokenize()).parse()
+    tree = T.FlatAST.from_tree(program).to_tree(100)
+    assert [n.id for n in T.walk(tree)] == [n.id + 100 for n in T.walk(program)]
+    assert tree.ids.next == program.ids.next + 100
+
+
+def shape(e):
+    if isinstance(e, T.BinaryOp):
+        return shape(e.left), e.op, shape(e.right)
+    if isinstance(e, T.Number):
+        return e.value
+    return e.name
+
+
+def expr(src):
+    return shape(T.Parser(T.RegexLexer(src + ';').tokenize()).parse_expr())
+
+
+def test_precedence_and_associativity():
+    assert expr('a - b - c') == (('a', '-', 'b'), '-', 'c')
+    assert expr('a / b * c') == (('a', '/', 'b'), '*', 'c')
+    assert expr('a + b * c - d') == (('a', '+', ('b', '*', 'c')), '-', 'd')
+    assert expr('a < b + c == d') == (('a', '<', ('b', '+', 'c')), '==', 'd')
+    assert expr('-a * b') == ((0.0, '-', 'a'), '*', 'b')
+    assert expr('a * -b - c') == (('a', '*', (0.0, '-', 'b')), '-', 'c')
+    assert expr('- - a') == (0.0, '-', (0.0, '-', 'a'))
+
+
+@pytest.fixture
+def logic_ops(monkeypatch):
+    # El lenguaje no tiene ^, || ni &&: se agregan a la tabla y los tokens se
+    # arman a mano, que es todo lo que hace falta para un operador nuevo
+    monkeypatch.setattr(T, 'BINARY_PRECEDENCE', {
+        '||': 1, '&&': 2, '==': 3, '<': 3, '+': 4, '-': 4, '*': 5, '/': 5, '^': 6,
+    })
+    monkeypatch.setattr(T, 'RIGHT_ASSOC', frozenset(('^',)))
+
+    def parse(src):
+        tokens = [T.Token('OP' if w in T.BINARY_PRECEDENCE else 'ID', w, 1, i + 1)
+                  for i, w in enumerate(src.split())]
+        tokens += [T.Token('SEMICOLON', ';', 1, 99), T.Token('EOF', '', 1, 100)]
+        return shape(T.Parser(tokens).parse_expr())
+    return parse
+
+
+def test_table_driven_operators(logic_ops):
+    assert logic_ops('a ^ b ^ c') == ('a', '^', ('b', '^', 'c'))
+    assert logic_ops('a - b - c') == (('a', '-', 'b'), '-', 'c')
+    assert logic_ops('a || b && c == d + e * f') == \
+        ('a', '||', ('b', '&&', ('c', '==', ('d', '+', ('e', '*', 'f')))))
+    assert logic_ops('a * b ^ c ^ d + e') == (('a', '*', ('b', '^', ('c', '^', 'd'))), '+', 'e')
+    assert logic_ops('a && b || c && d') == (('a', '&&', 'b'), '||', ('c', '&&', 'd'))
+
+
+def lazy(src, recover=False):
+    parser = T.Parser(T.RegexLexer(src).tokenize(), recover=recover, lazy_bodies=True)
+    return parser, parser.parse()
+
+
+def test_lazy_body_parsed_on_first_access():
+    src = 'function f(a) { b = a + 1; return b; } procedure p() { x = f(2); } y = 3;'
+    parser, program = lazy(src)
+    f, p = program.decls[0], program.decls[1]
+    assert f._lazy is not None and p._lazy is not None and f._body is None
+    assert [d.__class__.__name__ for d in program.decls] == ['FunctionDecl', 'ProcedureDecl', 'Assign']
+    before = parser.ids.next
+    body = f.body
+    assert f._lazy is None and parser.ids.next > before and p._lazy is not None
+    assert f.body is body
+    eager = T.Parser(T.RegexLexer(src).tokenize()).parse()
+    assert T.TACGenerator().generate(program) == T.TACGenerator().generate(eager)
+
+
+def test_lazy_body_unbalanced_parses_eagerly():
+    src = 'x = 1; function f() { if (x) { y = 2; } '
+    with pytest.raises(T.ParserError) as eager:
+        T.Parser(T.RegexLexer(src).tokenize()).parse()
+    with pytest.raises(T.ParserError) as deferred:
+        lazy(src)
+    assert (str(deferred.value), deferred.value.linea, deferred.value.columna) == \
+        (str(eager.value), eager.value.linea, eager.value.columna)
+    parser, program = lazy(src, recover=True)
+    assert program.decls[1]._lazy is None and parser.errors
+
+
+def test_lazy_body_errors_surface_when_parsed():
+    src = 'function f() {\n  a = 1;\n  b = ;\n}\ny = 2;'
+    with pytest.raises(T.ParserError) as eager:
+        T.Parser(T.RegexLexer(src).tokenize()).parse()
+    parser, program = lazy(src)
+    assert len(program.decls) == 2 and not parser.errors
+    with pytest.raises(T.ParserError) as deferred:
+        program.decls[0].body
+    assert (str(deferred.value), deferred.value.linea) == (str(eager.value), 3)
+    parser, program = lazy(src, recover=True)
+    assert not parser.errors
+    body = program.decls[0].body
+    assert [str(e) for e in parser.errors] == [str(eager.value)]
+    assert [s.__class__.__name__ for s in body] == ['Assign']
+
+
+def recovering(src):
+    parser = T.Parser(T.RegexLexer(src).tokenize(), recover=True)
+    program = parser.parse()
+    return [(e.linea, e.columna) for e in parser.errors], T.TACGenerator().generate(program)
+
+
+def test_recover_reports_every_error():
+    src = 'x = ;\ny = 2;\nz = * 3;\nfunction f() {\n  a = ;\n  b = 1;\n}\nw = );\nv = 4;'
+    errors, code = recovering(src)
+    assert errors == [(1, 5), (3, 5), (5, 7), (8, 5)]
+    assert code == ['t0 = 2.0', 'y = t0', 'label func_f', 't0 = 1.0', 'b = t0', 't0 = 4.0', 'v = t0']
+
+
+def test_recover_synchronizes_at_semicolon_and_brace():
+    # ';' dentro de un bloque: sigue con la sentencia siguiente del bloque
+    errors, code = recovering('if (a) { x = ; y = 1; } z = 2;')
+    assert errors == [(1, 14)]
+    assert code[1:3] == ['t0 = 1.0', 'y = t0'] and code[-1] == 'z = t0'
+    # '}' cierra el bloque aunque la sentencia no termine
+    errors, code = recovering('function f() { a = 1 + } b = 2;')
+    assert errors == [(1, 24)]
+    assert code == ['label func_f', 't0 = 2.0', 'b = t0']
+
+
+@pytest.mark.parametrize('src', [
+    'x = 1; y = ; z = 3;',
+    'function f() { a = 1 + } b = 2;',
+    'if (a) { x = 1; ',
+    'x = (1 + 2;',
+    'x = 1 y = 2;',
+])
+def test_recover_single_error_matches_plain_parse(src):
+    with pytest.raises(T.ParserError) as plain:
+        T.Parser(T.RegexLexer(src).tokenize()).parse()
+    parser = T.Parser(T.RegexLexer(src).tokenize(), recover=True)
+    parser.parse()
+    assert len(parser.errors) == 1
+    e = parser.errors[0]
+    assert (type(e), str(e), e.linea, e.columna) == \
+        (type(plain.value), str(plain.value), plain.value.linea, plain.value.columna)
+
+
+def test_parse_parallel_rejects_token_buffer():
+    with open(DATOS, encoding='utf-8') as f:
+        src = f.read() * 5
+    parser = T.Parser(T.TokenBuffer(T.Lexer(src).iter_tokens()))
+    with pytest.raises(Exception, match='parse_parallel necesita una lista de tokens'):
+        parser.parse_parallel(workers=2, min_tokens=1)
+
+
+def test_expr_factory_shares_names_by_default():
+    src = 'x = r * r + r * r; A[3] = A[3] + A[3]; y = f(a, b) + f(a, b);'
+    pool = T.StringPool()
+    f = T.ExprFactory()
+    shared = T.Parser(T.RegexLexer(src, pool=pool).tokenize(), exprs=f).parse()
+    e = shared.decls[0].expr
+    assert e.left is e.right and e.left.left is e.left.right
+    assert shared.decls[1].expr.left is shared.decls[1].expr.right
+    assert shared.decls[2].expr.left is shared.decls[2].expr.right and f.hits
+    plain = T.Parser(T.RegexLexer(src, pool=pool).tokenize()).parse()
+    assert [d.expr for d in plain.decls] == [d.expr for d in shared.decls]
+    assert T.TACGenerator(pool).generate(plain) == T.TACGenerator(pool).generate(shared)
@@ -0,0 +1,211 @@
+import contextlib
+import dataclasses
+import io
+import os
+import random
+
+import pytest
+
+import tablasimbolos as T
+
+ENTRIES = [
+    T.SymbolEntry('x', 'var', 'float', 0, 0, 8),
+    T.SymbolEntry('f', 'func', None, 0, None, None, ['a', 'b'], 'int', 'func_f'),
+    T.SymbolEntry('T', 'type', 'T', 0, extra={'fields': [('a', None)]}),
+    T.SymbolEntry('L0', 'label', label='L0'),
+]
+
+
+def test_store_round_trip():
+    store = T.SymbolStore()
+    for e in ENTRIES:
+        store.append(e.name, e.sym_type, e.data_type, e.scope_level, e.address, e.size,
+                     e.params, e.return_type, e.label, e.extra)
+    for row, e in enumerate(ENTRIES):
+        assert dataclasses.asdict(store.entry(row)) == dataclasses.asdict(e)
+    assert store.labels == [None, 'func_f', None, 'L0']
+    assert 'L0' not in store.values and 'func_f' not in store.values
+    view = store.entry(0)
+    view.address, view.label, view.params, view.sym_type = None, 'L9', ['p'], 'param'
+    assert (view.address, view.label, view.params, view.sym_type) == (None, 'L9', ['p'], 'param')
+    view.params = None
+    assert view.params is None and 0 not in store.sparse['params']
+    assert store.entry(1).name == 'f'
+
+
+def test_add_keeps_entry_identity():
+    st = T.SymbolTable()
+    x = T.SymbolEntry('x', 'var', 'float')
+    f = T.SymbolEntry('f', 'func', params=['a'], label='func_f')
+    st.add(x)
+    st.add(f)
+    assert st.lookup('x') is x and st.lookup('f') is f
+    assert isinstance(x, T.SymbolEntry)
+    assert (x.scope_level, x.address, x.size) == (0, 0, 8)
+    f.size = 32
+    f.label = 'func_g'
+    assert st.lookup('f').size == 32 and st.lookup('f').label == 'func_g'
+    assert 'func_g' in repr(st)
+    row = st.declare('y', 'var', 'float')
+    assert st.lookup('y') is st.lookup('y') is st.entry(row)
+
+
+def test_repr_matches_entries():
+    st = T.SymbolTable()
+    for e in ENTRIES:
+        st.add(dataclasses.replace(e))
+    assert repr(st) == T.format_symbols(ENTRIES)
+
+
+def test_redeclaration(capsys):
+    st = T.SymbolTable()
+    first = T.SymbolEntry('x', 'var', 'float')
+    st.add(first)
+    row = st.declare('x', 'const', 'int', size=16)
+    assert 'redeclaracion' in capsys.readouterr().out
+    x = st.lookup('x')
+    assert x is not first and x is st.entry(row)
+    assert (x.sym_type, x.data_type, x.address, x.size) == ('const', 'int', 8, 16)
+    assert first.sym_type == 'var' and first.address == 0
+    assert repr(st).count('\nx |') == 1
+
+
+@pytest.mark.parametrize('pool', [None, T.StringPool()])
+def test_shadowing_and_exit_scope(pool, capsys):
+    st = T.SymbolTable(pool)
+    st.declare('a', 'var', 'float')
+    st.declare('b', 'var', 'float')
+    st.enter_scope()
+    st.declare('a', 'param')
+    st.declare('c', 'var', 'int')
+    assert st.lookup('a').sym_type == 'param' and st.lookup('a').scope_level == 1
+    st.enter_scope()
+    st.declare('a', 'const')
+    st.declare('a', 'array')
+    assert 'redeclaracion' in capsys.readouterr().out
+    assert st.lookup('a').sym_type == 'array' and st.lookup('b').scope_level == 0
+    st.exit_scope()
+    assert st.lookup('a').sym_type == 'param'
+    st.exit_scope()
+    assert st.lookup('a').sym_type == 'var' and st.lookup('c') is None
+    assert st.find('c') == -1 and st.lookup('zzz') is None
+    if pool is not None:
+        assert st.lookup_id(pool.intern('a')) is st.lookup('a')
+    assert st.exit_scope() is None and st.current_level() == 0
+
+
+def test_bindings_match_scope_scan():
+    # Cualquier secuencia de declaraciones y scopes resuelve igual que
+    # recorrer los scopes abiertos de adentro hacia afuera
+    rnd = random.Random(7)
+    st = T.SymbolTable()
+    scopes = [{}]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for step in range(3000):
+            op = rnd.random()
+            if op < 0.15:
+                st.enter_scope()
+                scopes.append({})
+            elif op < 0.3 and len(scopes) > 1:
+                st.exit_scope()
+                scopes.pop()
+            else:
+                name = f"v{rnd.randrange(12)}"
+                scopes[-1][name] = st.declare(name, 'var', 'float', extra={'step': step})
+            for k in range(12):
+                name = f"v{k}"
+                want = next((s[name] for s in reversed(scopes) if name in s), -1)
+                assert st.find(name) == want
+                assert (st.lookup(name) is None) == (want < 0)
+
+
+def test_interval_index_ties():
+    outer, inner, same = T.Scope(1), T.Scope(2), T.Scope(3)
+    index = T.IntervalIndex([((1, 1, 10, 1), outer), ((1, 1, 5, 1), inner), ((1, 1, 5, 1), same),
+                             ((6, 1, 10, 1), 'tail')], 'root')
+    assert index.at(1, 1) is same and index.at(4, 9) is same
+    assert index.at(5, 1) is outer and index.at(6, 1) == 'tail' and index.at(9, 9) == 'tail'
+    assert index.at(10, 1) == 'root' and index.at(0, 5) == 'root'
+
+
+NESTED = """x = 1;
+function f(x) {
+  y = x;
+  if (x > 1) {
+    y = 2;
+    while (y) {
+      z = y;
+      y = y - 1;
+    }
+  } else if (x < 0) {
+    z = 3;
+  } else {
+    w = 4;
+  }
+  return y;
+}
+z = 5;
+"""
+
+
+def nested_table():
+    gen = T.TACGenerator()
+    gen.generate(T.Parser(T.RegexLexer(NESTED).tokenize()).parse())
+    return gen.symtab
+
+
+def test_scope_at_nested_blocks():
+    st = nested_table()
+    kinds = {(line, col): st.scope_at(line, col).kind for line, col in
+             [(1, 1), (3, 3), (5, 5), (7, 7), (10, 12), (11, 5), (13, 5), (15, 3), (17, 1)]}
+    assert kinds == {(1, 1): 'global', (3, 3): 'function f', (5, 5): 'if', (7, 7): 'while',
+                     (10, 12): 'else', (11, 5): 'if', (13, 5): 'else', (15, 3): 'function f',
+                     (17, 1): 'global'}
+    assert st.scope_at(11, 5).parent is st.scope_at(10, 12)
+    assert st.scope_at(11, 5) is not st.scope_at(5, 5)
+
+
+def test_lookup_at_shadowed_names():
+    st = nested_table()
+    assert st.lookup_at('x', 1, 1).sym_type == 'var'
+    assert st.lookup_at('x', 3, 7).sym_type == 'param'
+    assert st.lookup_at('x', 17, 1).sym_type == 'var'
+    inner = [st.lookup_at('z', line, col) for line, col in [(7, 7), (11, 5), (13, 5), (17, 1)]]
+    assert [e.scope_level for e in inner] == [3, 3, 0, 0]
+    assert inner[0] is not inner[1] and inner[2] is inner[3] is st.lookup('z')
+    assert st.lookup_at('w', 13, 5).scope_level == 3 and st.lookup_at('w', 11, 5) is None
+    assert st.lookup_at('y', 7, 7) is st.lookup_at('y', 3, 3)
+    assert st.lookup_at('nada', 3, 3) is None
+
+
+DATOS = os.path.join(os.path.dirname(T.__file__), 'datos.txt')
+
+
+@pytest.mark.parametrize('datos', [False, True])
+def test_sqlite_export_matches_table(tmp_path, datos):
+    if datos:
+        with open(DATOS, encoding='utf-8') as f:
+            src = f.read()
+        gen = T.TACGenerator()
+        with contextlib.redirect_stdout(io.StringIO()):
+            gen.generate(T.Parser(T.RegexLexer(src).tokenize()).parse())
+        st = gen.symtab
+    else:
+        st = nested_table()
+    path = str(tmp_path / 'simbolos.db')
+    st.export_sqlite(path)
+    names = sorted(set(st.store.names)) + ['nada']
+    rows = [r for scope in st.all_scopes for r in scope.rows]
+    as_dict = lambda e: None if e is None else dataclasses.asdict(e)
+    with T.SymbolDB(path) as db:
+        assert len(db) == len(rows)
+        assert repr(db) == repr(st)
+        for name in names:
+            assert as_dict(db.lookup(name)) == as_dict(st.lookup(name)), name
+            for line in range(0, 40):
+                for col in range(0, 30, 3):
+                    assert as_dict(db.lookup_at(name, line, col)) == as_dict(st.lookup_at(name, line, col)), \
+                        (name, line, col)
+        for kind in ('var', 'param', 'label', 'func', 'proc', 'type', 'const', 'array'):
+            assert [as_dict(e) for e in db.of_kind(kind)] == \
+                [as_dict(st.entry(r)) for r in rows if st.entry(r).sym_type == kind]
@@ -0,0 +1,105 @@
+import os
+import re
+
+import tablasimbolos as T
+
+
+def parse(src):
+    return T.Parser(T.RegexLexer(src).tokenize()).parse()
+
+
+def test_accept_runs_node_visitor():
+    expr = parse('x = a + b * c;').decls[0].expr
+    direct = T.TACGenerator()
+    expected = direct.visit_expr(expr)
+    gen = T.TACGenerator()
+    assert expr.accept(gen) == expected
+    assert gen.code == direct.code and gen.code
+
+
+def test_accept_renders_whole_subtree():
+    program = parse('if (x > 1) { y = 2; }')
+    v = T.ASTVisualizer(T.IdAllocator(100))
+    program.accept(v)
+    labels = [line for line in v.lines if 'label=' in line]
+    assert len(labels) == sum(1 for _ in T.walk(program)) + 1
+
+
+def test_tac_generator_align():
+    program = parse('x = 1; function f(a) { b = a; return b; } y = 2;')
+    gen = T.TACGenerator(align=16)
+    gen.generate(program)
+    st = gen.symtab
+    assert st.align == 16
+    assert [st.lookup(n).address for n in ('x', 'f', 'y')] == [0, None, 16]
+    assert st.lookup('f').size % 16 == 0
+    assert T.TACGenerator().symtab.align == 8
+
+
+def test_render_keeps_program_ids():
+    program = parse('if (x > 1) { y = 2; } else { y = 3; } while (y) { y = y - 1; }')
+    before = program.ids.next
+    dot = T.ASTVisualizer().render(program)
+    assert program.ids.next == before
+    assert T.ASTVisualizer().render(program) == dot
+
+
+def test_render_names_hand_built_nodes():
+    f = T.ExprFactory()
+    x = T.Var('x')
+    assert f.intern(x) is None and f.intern(T.Var('x')) is x
+    program = T.Program([T.Assign(T.Var('y'), T.BinaryOp(x, '+', T.Number(1))),
+                         T.ExprStmt(T.Call('f', [x]))])
+    dot = T.ASTVisualizer().render(program)
+    labels = [line.split()[0] for line in dot.splitlines() if 'label=' in line]
+    assert 'n-1' not in dot
+    # x es un solo nodo compartido: se dibuja dos veces con el mismo nombre
+    assert len(labels) == sum(1 for _ in T.walk(program))
+    assert len(set(labels)) == len(labels) - 1
+
+
+def tac(src, reuse=True):
+    gen = T.TACGenerator()
+    if not reuse:
+        gen.temps.release = lambda *names: None
+    return gen.generate(parse(src)), gen.temps
+
+
+def check_temps(src):
+    # Contra el mismo codigo sin reutilizar nombres: cada lectura de un
+    # temporal ve el mismo valor (la misma instruccion que lo escribio)
+    code, temps = tac(src)
+    plain, _ = tac(src, reuse=False)
+    assert len(code) == len(plain)
+    temp = re.compile(r't\d+')
+    values = {}
+    for line, ref in zip(code, plain):
+        words, ref_words = line.replace(',', ' ').split(), ref.replace(',', ' ').split()
+        assert len(words) == len(ref_words)
+        write = len(words) > 2 and words[1] == '='
+        for w, r in zip(words[2 if write else 1:], ref_words[2 if write else 1:]):
+            assert values.get(w, w) == r if temp.fullmatch(w) else w == r, line
+        if write:
+            values[words[0]] = ref_words[0]
+    return code, temps
+
+
+def test_temps_reused_after_last_use():
+    code, temps = check_temps('x = 1 + 2; y = 3 * 4;')
+    assert code == ['t0 = 1.0', 't1 = 2.0', 't0 = t0 + t1', 'x = t0',
+                    't0 = 3.0', 't1 = 4.0', 't0 = t0 * t1', 'y = t0']
+    assert temps.count == 2 and not temps.live
+
+
+def test_temps_not_shared_between_live_arguments():
+    code, temps = check_temps('x = f(1 + 2, g(3, a * 4), 5) + 6;')
+    params = [line.split()[1] for line in code if line.startswith('param')]
+    assert params == ['t1', 't2', 't0', 't1', 't2']
+    assert temps.count == 3
+
+
+def test_temps_on_datos():
+    with open(os.path.join(os.path.dirname(T.__file__), 'datos.txt'), encoding='utf-8') as f:
+        src = f.read()
+    code, temps = check_temps(src + 'A[1 + 2] = A[3] + p.edad; while (x > 0) { x = x - f(x, 1); }')
+    assert temps.count < sum(1 for line in code if re.match(r't\d+ = ', line))
@@ -0,0 +1,57 @@
+import pytest
+
+import tablasimbolos as T
+
+SRC = 'x = 1; y = x + x;\nz = x * 2; w = x + x;'
+
+
+def symtab(src, lazy=False, **kw):
+    program = T.Parser(T.RegexLexer(src, lazy_positions=lazy).tokenize(), **kw).parse()
+    gen = T.TACGenerator()
+    gen.generate(program)
+    return gen.symtab, program
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_factory_keeps_every_use(lazy):
+    plain, _ = symtab(SRC)
+    st, _ = symtab(SRC, lazy, exprs=T.ExprFactory(), positions=True)
+    x = st.lookup('x')
+    reads = st.uses(x, 'read')
+    assert len(set(reads)) == 5
+    assert reads == plain.uses(plain.lookup('x'), 'read')
+    assert st.definition(x) == plain.definition(plain.lookup('x')) == (1, 1)
+
+
+def test_lazy_positions_resolve_on_demand():
+    _, program = symtab(SRC, lazy=True)
+    var = program.decls[1].expr.left
+    assert isinstance(var.pos, T.LazyToken)
+    assert T._stored_position(var, 'pos') == (1, 12)
+    eager, _ = symtab(SRC)
+    lazy, _ = symtab(SRC, lazy=True)
+    for name in 'xyzw':
+        a, b = eager.lookup(name), lazy.lookup(name)
+        assert eager.uses(a) == lazy.uses(b)
+        assert eager.definition(a) == lazy.definition(b)
+
+
+def test_shared_nodes_without_positions():
+    # Con ExprFactory el Parser no anota posiciones salvo que se le pida
+    for kw in ({}, {'positions': False}):
+        st, program = symtab(SRC, exprs=T.ExprFactory(), **kw)
+        expr = program.decls[1].expr
+        assert expr.left is expr.right and expr.left.pos is None
+        assert st.uses(st.lookup('x')) == [] and st.definition(st.lookup('x')) is None
+    st, program = symtab(SRC, exprs=T.ExprFactory(), positions=True)
+    expr = program.decls[1].expr
+    assert expr.left is not expr.right and expr.left == expr.right
+
+
+def test_stored_positions_are_tuples():
+    _, program = symtab('function f(a, b) { c = a + b; return c; }', lazy=True)
+    records = T.ASTCache.encode(program)
+    flat = T.FlatAST.from_tree(program)
+    _, eager = symtab('function f(a, b) { c = a + b; return c; }')
+    assert records == T.ASTCache.encode(eager)
+    assert flat.payloads == T.FlatAST.from_tree(eager).payloads